@@ -0,0 +1,157 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+import storage
+
+# --- Backups and Log Export ---
+# A backup copies the database with SQLite's online backup API, a few hundred
+# pages per step, from a connection pinned to one read snapshot. Writers keep
+# committing to the WAL and the copy stays consistent. The copy is then
+# gzip-compressed in chunks. Exports stream `sms_log` rows from a cursor
+# straight into a gzip file, so memory use does not grow with the log. Both
+# run on one background thread, which hands the finished file to `send`.
+
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+COPY_CHUNK = 1024 * 1024
+EXPORT_FETCH = 500
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_COLUMNS = ('log_id', 'user_id', 'phone_number', 'message', 'timestamp')
+
+
+def snapshot(dest_path, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP):
+    source = sqlite3.connect(storage.DB_PATH, timeout=storage.BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    target = sqlite3.connect(dest_path, isolation_level=None)
+    try:
+        # Holding a read transaction pins the snapshot, so commits made by
+        # other connections while we copy do not restart the backup.
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages, sleep=sleep)
+        source.execute("COMMIT")
+    finally:
+        target.close()
+        source.close()
+
+
+def compress(source_path, dest_path):
+    with open(source_path, 'rb') as source, gzip.open(dest_path, 'wb') as dest:
+        shutil.copyfileobj(source, dest, COPY_CHUNK)
+
+
+def write_backup(dest_path):
+    # Writes a gzip-compressed, consistent copy of the database to dest_path.
+    fd, raw_path = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(dest_path)))
+    os.close(fd)
+    try:
+        snapshot(raw_path)
+        compress(raw_path, dest_path)
+    finally:
+        os.remove(raw_path)
+
+
+def _export_rows(start_day=None, end_day=None, user_id=None):
+    # Days are inclusive YYYY-MM-DD bounds; timestamps are ISO strings, so the
+    # comparison is a range seek on the timestamp indexes.
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if start_day:
+        clauses.append("timestamp >= ?")
+        params.append(start_day)
+    if end_day:
+        clauses.append("timestamp < ?")
+        params.append(str(datetime.date.fromisoformat(end_day) + datetime.timedelta(days=1)))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cursor = storage.get_connection().execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM sms_log {where} ORDER BY timestamp, log_id", params)
+    while True:
+        rows = cursor.fetchmany(EXPORT_FETCH)
+        if not rows:
+            break
+        yield from rows
+
+
+def export_sms_log(out, fmt='csv', start_day=None, end_day=None, user_id=None):
+    # `out` is a text stream. Returns the number of rows written.
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in _export_rows(start_day, end_day, user_id):
+            writer.writerow(tuple(row))
+            count += 1
+    else:
+        for row in _export_rows(start_day, end_day, user_id):
+            out.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def write_export(dest_path, fmt='csv', start_day=None, end_day=None, user_id=None):
+    with gzip.open(dest_path, 'wb') as raw, io.TextIOWrapper(raw, encoding='utf-8', newline='') as out:
+        return export_sms_log(out, fmt, start_day, end_day, user_id)
+
+
+class BackupWorker:
+    def __init__(self, send, on_error, directory=None):
+        # send(chat_id, path, filename, rows) uploads a finished file; rows is
+        # the exported row count, or None for a backup.
+        # on_error(chat_id, error) reports a failed job.
+        self.send = send
+        self.on_error = on_error
+        self.directory = directory or tempfile.gettempdir()
+        self._jobs = queue.Queue()
+
+    def request_backup(self, chat_id):
+        self._jobs.put(('backup', chat_id, None))
+
+    def request_export(self, chat_id, fmt='csv', start_day=None, end_day=None, user_id=None):
+        self._jobs.put(('export', chat_id, (fmt, start_day, end_day, user_id)))
+
+    def depth(self):
+        return self._jobs.qsize()
+
+    def start(self):
+        threading.Thread(target=self._run, name="backup-worker", daemon=True).start()
+
+    def _run_job(self, kind, chat_id, options):
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        if kind == 'backup':
+            filename = f"sms_bot-{stamp}.db.gz"
+        else:
+            filename = f"sms_log-{stamp}.{options[0]}.gz"
+        path = os.path.join(self.directory, filename)
+        try:
+            if kind == 'backup':
+                write_backup(path)
+                rows = None
+            else:
+                rows = write_export(path, *options)
+            self.send(chat_id, path, filename, rows)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _run(self):
+        while True:
+            kind, chat_id, options = self._jobs.get()
+            try:
+                self._run_job(kind, chat_id, options)
+            except Exception as e:
+                print(f"{kind.capitalize()} job failed: {e}")
+                try:
+                    self.on_error(chat_id, e)
+                except Exception as e:
+                    print(f"Could not report failed {kind} job: {e}")
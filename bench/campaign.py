@@ -0,0 +1,120 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from fakes import FakeGateway
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# --- Bulk Campaign Benchmark ---
+# Writes a CSV of N numbers, streams it into a campaign and sends it through
+# the pooled gateway client to the fake gateway. Reports:
+#   * peak Python memory (tracemalloc) above the starting point while
+#     parsing and while sending, for each list size; it should stay flat as
+#     the list grows;
+#   * sends per second at each concurrency, next to the ceiling the fake
+#     gateway's latency allows (concurrency / latency).
+# Send limits are out of scope here; every reservation is granted.
+#
+# Usage (from the repository root):
+#   python bench/campaign.py --numbers 10000 --concurrency 4,8,16 --gateway-latency 0.02
+
+
+def write_numbers(path, count):
+    with open(path, 'w') as out:
+        out.write("name,phone\n")
+        for index in range(count):
+            out.write(f"bench{index},+88017{index:08d}\n")
+
+
+class _MemoryPhase:
+    # Peak traced memory above what was allocated when the phase began.
+    def __init__(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self.start = tracemalloc.get_traced_memory()[0]
+
+    def growth(self):
+        return tracemalloc.get_traced_memory()[1] - self.start if tracemalloc.is_tracing() else None
+
+
+def run_campaign(runner, storage, path, user_id):
+    done = threading.Event()
+    runner.on_progress = lambda campaign, final: final and done.set()
+    campaign_id = runner.create(user_id, "bench", user_id)
+    phase = _MemoryPhase()
+    with open(path) as numbers:
+        added, invalid, duplicates = runner.add_numbers(campaign_id, numbers)
+    parsed = phase.growth()
+    phase = _MemoryPhase()
+    started = time.perf_counter()
+    runner.start(campaign_id, "bench message", 1)
+    done.wait()
+    elapsed = time.perf_counter() - started
+    sent = runner.get(campaign_id)['sent']
+    sending = phase.growth()
+    return {'added': added, 'sent': sent, 'elapsed': elapsed, 'per_second': sent / elapsed, 'parse_peak': parsed, 'send_peak': sending}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send bulk campaigns to a fake gateway and report memory and throughput")
+    parser.add_argument('--numbers', type=int, default=10000)
+    parser.add_argument('--memory-sizes', default='1000,10000,30000', help="list sizes for the memory pass")
+    parser.add_argument('--concurrency', default='4,8,16', help="comma-separated BULK_CONCURRENCY values")
+    parser.add_argument('--gateway-latency', type=float, default=0.02)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='smsbot-campaign-')
+    os.environ['DB_PATH'] = os.path.join(workdir, 'sms_bot.db')
+    gateway = FakeGateway().start()
+    try:
+        import storage
+        from campaigns import CampaignRunner
+        from sms_gateway import GatewayClient
+        storage.setup_database()
+        concurrencies = [int(value) for value in args.concurrency.split(',')]
+        client = GatewayClient(f"{gateway.url}/send", pool_size=max(concurrencies))
+
+        def send(campaign, phone_number):
+            return client.send(phone_number, campaign['message']).status_code == 200
+
+        def runner_for(concurrency):
+            return CampaignRunner(send, lambda user_id, phone_number: None, lambda hold_id: None, None,
+                                  concurrency=concurrency, progress_interval=1.0)
+
+        print("memory (no gateway latency, concurrency 16):")
+        tracemalloc.start()
+        # A first small campaign so one-time allocations (connections,
+        # threads, caches) are not counted against the first list size.
+        path = os.path.join(workdir, "numbers-warmup.csv")
+        write_numbers(path, 100)
+        run_campaign(runner_for(16), storage, path, 999)
+        for user_id, size in enumerate(int(value) for value in args.memory_sizes.split(',')):
+            path = os.path.join(workdir, f"numbers-{size}.csv")
+            write_numbers(path, size)
+            result = run_campaign(runner_for(16), storage, path, 1000 + user_id)
+            print(f"  {size:>7} numbers: parse peak +{result['parse_peak'] / 1024:.0f} KiB, send peak +{result['send_peak'] / 1024:.0f} KiB, {result['sent']} sent")
+        tracemalloc.stop()
+
+        gateway.latency = args.gateway_latency
+        path = os.path.join(workdir, f"numbers-{args.numbers}.csv")
+        write_numbers(path, args.numbers)
+        print(f"throughput ({args.numbers} numbers, gateway latency {args.gateway_latency * 1000:.0f} ms):")
+        for user_id, concurrency in enumerate(concurrencies):
+            result = run_campaign(runner_for(concurrency), storage, path, 2000 + user_id)
+            ceiling = concurrency / args.gateway_latency if args.gateway_latency else float('inf')
+            print(f"  concurrency {concurrency:>3}: {result['per_second']:7.1f} sends/s (ceiling {ceiling:.0f}), {result['sent']}/{result['added']} sent in {result['elapsed']:.1f}s")
+    finally:
+        gateway.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
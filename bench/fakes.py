@@ -0,0 +1,144 @@
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# --- Local Stand-ins for the Telegram Bot API and the SMS Gateway ---
+# Both run on a background thread in the benchmark process, on 127.0.0.1 and
+# a free port. They add the configured latency to each call and count what
+# they were asked to do. The load generator registers expectations on the
+# fake Bot API to time each update from POST to the bot's reply.
+
+
+class _Server:
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.server = None
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def start(self):
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without this, Nagle
+            # plus delayed ACKs add ~40 ms to every call on a kept-alive connection.
+            disable_nagle_algorithm = True
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self):
+                url = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if body and self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                    params.update({key: values[-1] for key, values in parse_qs(body.decode()).items()})
+                status, payload = owner.handle(url.path, params)
+                self._reply(status, payload)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def stop(self):
+        self.server.shutdown()
+
+
+class FakeTelegram(_Server):
+    # Answers the Bot API methods the bot uses. Calls are matched against
+    # expectations registered with expect() by chat_id, or by
+    # callback_query_id for answerCallbackQuery.
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        super().__init__(latency, jitter)
+        self._message_ids = itertools.count(1000)
+        self._expectations = {}
+
+    def expect(self, chat_id, callback, predicate=None):
+        # callback(method, params, result) runs once, for the first later
+        # call to chat_id (or callback query id) that satisfies
+        # predicate(method, params).
+        with self.lock:
+            self._expectations.setdefault(str(chat_id), []).append((predicate, callback))
+
+    def cancel(self, chat_id, callback):
+        with self.lock:
+            expectations = self._expectations.get(str(chat_id), [])
+            expectations[:] = [expectation for expectation in expectations if expectation[1] is not callback]
+
+    def _notify(self, method, params, result):
+        chat_id = params.get('chat_id') or params.get('callback_query_id')
+        if chat_id is None:
+            return
+        matched = []
+        with self.lock:
+            expectations = self._expectations.get(str(chat_id), [])
+            for expectation in list(expectations):
+                predicate, callback = expectation
+                if predicate is None or predicate(method, params):
+                    expectations.remove(expectation)
+                    matched.append(callback)
+                    break
+        for callback in matched:
+            callback(method, params, result)
+
+    def handle(self, path, params):
+        method = path.rsplit('/', 1)[-1]
+        self.delay()
+        self.count(method)
+        if method == 'getChatMember':
+            result = {'status': 'member', 'user': {'id': int(params.get('user_id', 0)), 'is_bot': False, 'first_name': 'bench'}}
+        elif method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            result = {'message_id': next(self._message_ids), 'date': int(time.time()), 'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'}, 'text': params.get('text', '')}
+        elif method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        else:
+            result = True
+        self._notify(method, params, result)
+        return 200, {'ok': True, 'result': result}
+
+
+class FakeGateway(_Server):
+    # Any GET is a send; `error_rate` of them answer 500.
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        super().__init__(latency, jitter)
+        self.error_rate = error_rate
+
+    def handle(self, path, params):
+        self.delay()
+        if random.random() < self.error_rate:
+            self.count('error')
+            return 500, {'status': 'error'}
+        self.count('ok')
+        return 200, {'status': 'ok'}
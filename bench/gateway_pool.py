@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import requests
+
+from fakes import FakeGateway
+from load import summarize
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sms_gateway import GatewayClient  # noqa: E402
+
+# --- Gateway Client Benchmark ---
+# Sends the same number of SMS to the fake gateway twice from `threads`
+# threads: once with a bare requests.get per message (the original
+# sms_command), once through the pooled keep-alive GatewayClient. Reports
+# sends per second and per-call latency for each.
+#
+# Usage (from the repository root):
+#   python bench/gateway_pool.py --sends 2000 --threads 8 --gateway-latency 0.005
+
+
+def unpooled_sender(url):
+    def send(phone_number, text):
+        return requests.get(url, params={'number': phone_number, 'sms': text}, timeout=30)
+    return send
+
+
+def pooled_sender(url, pool_size):
+    client = GatewayClient(url, pool_size=pool_size)
+    return client.send
+
+
+def run(send, sends, threads):
+    latencies, failures = [], []
+    lock = threading.Lock()
+    remaining = iter(range(sends))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(remaining, None)
+            if index is None:
+                return
+            started = time.perf_counter()
+            response = send(f"017{index:08d}", "bench message")
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {'sends': sends, 'elapsed': elapsed, 'per_second': sends / elapsed, 'failures': len(failures), 'latency': summarize(latencies)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare unpooled and pooled SMS gateway sends against a local fake gateway")
+    parser.add_argument('--sends', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--gateway-latency', type=float, default=0.005, help="seconds added to every gateway call")
+    args = parser.parse_args(argv)
+
+    gateway = FakeGateway(latency=args.gateway_latency).start()
+    try:
+        url = f"{gateway.url}/send"
+        results = {
+            'unpooled': run(unpooled_sender(url), args.sends, args.threads),
+            'pooled': run(pooled_sender(url, args.threads), args.sends, args.threads),
+        }
+    finally:
+        gateway.stop()
+    for name, result in results.items():
+        latency = result['latency']
+        print(f"{name:<9} {result['per_second']:8.1f} sends/s  p50 {latency['p50'] * 1000:6.1f} ms  p99 {latency['p99'] * 1000:6.1f} ms  failures {result['failures']}")
+    print(f"pooled / unpooled: {results['pooled']['per_second'] / results['unpooled']['per_second']:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import itertools
+import json
+import random
+import threading
+import time
+
+import requests
+
+# --- Synthetic Update Stream ---
+# `concurrency` virtual clients each own a slice of users and run closed-loop:
+# POST one update to the webhook, wait for the bot's reply on the fake Bot
+# API, then send the next. Two latencies are recorded per update: the webhook
+# ack (HTTP round trip) and the reply (POST until the bot's first answer in
+# that chat). For /sms the time until the "sent" edit is also recorded.
+
+UPDATE_MIX = (('start', 20), ('sms', 40), ('history', 25), ('stats', 15))
+FIRST_USER_ID = 100000
+CALLBACK_MESSAGE_ID = 1
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(values):
+    return {'count': len(values), 'p50': percentile(values, 0.50), 'p99': percentile(values, 0.99)}
+
+
+def is_message_reply(method, params):
+    return method == 'sendMessage'
+
+
+def is_callback_reply(method, params):
+    # Not the delivery edit of an earlier /sms, which edits its own message.
+    return method == 'editMessageText' and params.get('message_id') == str(CALLBACK_MESSAGE_ID)
+
+
+REPLY_PREDICATES = {'start': is_message_reply, 'sms': is_message_reply, 'history': is_callback_reply, 'stats': is_callback_reply}
+
+
+class LoadGenerator:
+    def __init__(self, webhook_url, telegram, concurrency=16, users_per_client=50, duration=30.0,
+                 mix=UPDATE_MIX, reply_timeout=30.0, secret=None):
+        # Client i uses admin id i + 1 for admin updates, so ADMIN_IDS must
+        # list admin_ids() for the bot under test.
+        self.webhook_url = webhook_url
+        self.telegram = telegram
+        self.concurrency = concurrency
+        self.users_per_client = users_per_client
+        self.duration = duration
+        self.kinds = [kind for kind, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.reply_timeout = reply_timeout
+        self.headers = {'Content-Type': 'application/json'}
+        if secret:
+            self.headers['X-Telegram-Bot-Api-Secret-Token'] = secret
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.ack = {kind: [] for kind in self.kinds}
+        self.reply = {kind: [] for kind in self.kinds}
+        self.delivery = []
+        self.timeouts = {kind: 0 for kind in self.kinds}
+        self.errors = 0
+        self.sent = 0
+
+    def admin_ids(self):
+        return [client + 1 for client in range(self.concurrency)]
+
+    # --- Update builders ---
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f"bench{user_id}", 'username': f"bench{user_id}"}
+
+    def _message(self, user_id, text):
+        message = {'message_id': next(self._ids), 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'}, 'from': self._user(user_id), 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': next(self._ids), 'message': message}
+
+    def _callback(self, user_id, data):
+        message = {'message_id': CALLBACK_MESSAGE_ID, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'}, 'text': 'bench'}
+        return {'update_id': next(self._ids), 'callback_query': {'id': f"query{next(self._ids)}", 'chat_instance': 'bench', 'from': self._user(user_id), 'message': message, 'data': data}}
+
+    def build(self, kind, user_id, admin_id):
+        if kind == 'start':
+            return user_id, self._message(user_id, '/start')
+        if kind == 'sms':
+            return user_id, self._message(user_id, f"/sms 017{random.randrange(10 ** 8):08d} bench message")
+        if kind == 'history':
+            return user_id, self._callback(user_id, 'history_page_1')
+        return admin_id, self._callback(admin_id, 'show_stats')
+
+    # --- Running ---
+    def _record(self, bucket, kind, value):
+        with self._lock:
+            bucket[kind].append(value)
+
+    def _track_delivery(self, chat_id, started, method, params, result):
+        # Only a "queued" reply is followed by a delivery edit; a limit
+        # message is not.
+        if method != 'sendMessage' or not params.get('text', '').startswith('⏳'):
+            return
+        ack_id = str(result['message_id'])
+
+        def on_delivery(method, params, result):
+            with self._lock:
+                self.delivery.append(time.perf_counter() - started)
+        self.telegram.expect(chat_id, on_delivery, lambda method, params: method == 'editMessageText' and params.get('message_id') == ack_id)
+
+    def _client(self, index, deadline):
+        session = requests.Session()
+        users = [FIRST_USER_ID + index * self.users_per_client + offset for offset in range(self.users_per_client)]
+        admin_id = self.admin_ids()[index]
+        for user_id in itertools.cycle(users):
+            if time.monotonic() >= deadline:
+                return
+            kind = random.choices(self.kinds, self.weights)[0]
+            chat_id, update = self.build(kind, user_id, admin_id)
+            replied = threading.Event()
+            started = time.perf_counter()
+            reply_times = []
+
+            def on_reply(method, params, result, kind=kind, chat_id=chat_id, started=started, reply_times=reply_times, replied=replied):
+                if replied.is_set():
+                    return
+                reply_times.append(time.perf_counter() - started)
+                replied.set()
+                if kind == 'sms':
+                    self._track_delivery(chat_id, started, method, params, result)
+            self.telegram.expect(chat_id, on_reply, REPLY_PREDICATES[kind])
+            query_id = update.get('callback_query', {}).get('id')
+            if query_id:
+                # e.g. an empty history is answered with a popup instead of an edit.
+                self.telegram.expect(query_id, on_reply)
+            try:
+                response = session.post(self.webhook_url, data=json.dumps(update), headers=self.headers, timeout=self.reply_timeout)
+                ok = response.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            self._record(self.ack, kind, time.perf_counter() - started)
+            with self._lock:
+                self.sent += 1
+                if not ok:
+                    self.errors += 1
+            timed_out = not replied.wait(self.reply_timeout)
+            self.telegram.cancel(chat_id, on_reply)
+            if query_id:
+                self.telegram.cancel(query_id, on_reply)
+            if timed_out:
+                with self._lock:
+                    self.timeouts[kind] += 1
+                continue
+            self._record(self.reply, kind, reply_times[0])
+
+    def run(self):
+        deadline = time.monotonic() + self.duration
+        started = time.perf_counter()
+        clients = [threading.Thread(target=self._client, args=(index, deadline), daemon=True) for index in range(self.concurrency)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        self.elapsed = time.perf_counter() - started
+
+    def report(self):
+        with self._lock:
+            return {
+                'updates': self.sent,
+                'http_errors': self.errors,
+                'elapsed': self.elapsed,
+                'throughput': self.sent / self.elapsed if self.elapsed else 0.0,
+                'ack': {kind: summarize(values) for kind, values in self.ack.items()},
+                'reply': {kind: summarize(values) for kind, values in self.reply.items()},
+                'reply_all': summarize([value for values in self.reply.values() for value in values]),
+                'delivery': summarize(self.delivery),
+                'timeouts': dict(self.timeouts),
+            }
@@ -0,0 +1,93 @@
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from load import summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# --- Pagination Benchmark ---
+# Seeds one user with enough history, and enough users, for 10,000 pages of
+# 10, then times fetching pages 1, 10, ..., 10,000 with the original
+# LIMIT/OFFSET queries and with the keyset queries the bot uses now. Both run
+# on the current, indexed schema, so the difference is the OFFSET walk alone.
+#
+# Usage (from the repository root):
+#   python bench/pagination.py --pages 10000
+
+PER_PAGE = 10
+HEAVY_USER = 1
+OFFSET_HISTORY = "SELECT phone_number, timestamp FROM sms_log WHERE user_id = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?"
+OFFSET_USERS = "SELECT user_id, first_name, username FROM users ORDER BY user_id DESC LIMIT ? OFFSET ?"
+
+
+def seed(storage, pages, other_rows):
+    rows = pages * PER_PAGE + PER_PAGE
+    start = datetime.datetime.now() - datetime.timedelta(days=365)
+    step = 365 * 86400 / (rows + other_rows)
+    with storage.transaction() as conn:
+        conn.executemany("INSERT INTO users (user_id, first_name, username) VALUES (?, ?, ?)", ((user_id, f"user{user_id}", f"user{user_id}") for user_id in range(1, rows + 1)))
+        # The heavy user's rows are interleaved with everybody else's.
+        owners = [HEAVY_USER] * rows + [random.randint(2, rows) for _ in range(other_rows)]
+        random.shuffle(owners)
+        logged = [(user_id, f"017{random.randrange(10 ** 8):08d}", start + datetime.timedelta(seconds=index * step)) for index, user_id in enumerate(owners)]
+        conn.executemany("INSERT INTO sms_log (user_id, phone_number, message, timestamp, day) VALUES (?, ?, 'bench', ?, ?)", ((user_id, phone, stamp.isoformat(), str(stamp.date())) for user_id, phone, stamp in logged))
+    storage.rebuild_counters()
+
+
+def timed(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare OFFSET and keyset page latency for history and the user list")
+    parser.add_argument('--pages', type=int, default=10000, help="deepest page to fetch")
+    parser.add_argument('--other-rows', type=int, default=200000, help="sms_log rows belonging to other users")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='smsbot-pagination-')
+    os.environ['DB_PATH'] = os.path.join(workdir, 'sms_bot.db')
+    try:
+        import pagination
+        import storage
+        storage.setup_database()
+        seed(storage, args.pages, args.other_rows)
+        conn = storage.get_connection()
+        pages = [page for page in (1, 10, 100, 1000, 10000, 100000) if page <= args.pages]
+
+        print(f"{'page':>8}{'history offset':>16}{'history keyset':>16}{'users offset':>14}{'users keyset':>14}   p50 ms")
+        for page in pages:
+            offset = (page - 1) * PER_PAGE
+            # The cursor a "next" button on page - 1 would carry.
+            if page == 1:
+                log_cursor = user_cursor = None
+            else:
+                edge = conn.execute("SELECT timestamp, log_id FROM sms_log WHERE user_id = ? ORDER BY timestamp DESC, log_id DESC LIMIT 1 OFFSET ?", (HEAVY_USER, offset - 1)).fetchone()
+                log_cursor = pagination.decode_log_cursor(pagination.encode_log_cursor(edge[0], edge[1]))
+                user_cursor = conn.execute("SELECT user_id FROM users ORDER BY user_id DESC LIMIT 1 OFFSET ?", (offset - 1,)).fetchone()[0]
+                callback = pagination.make_callback("hist", pagination.OLDER, page, pagination.encode_log_cursor(edge[0], edge[1]))
+                assert len(callback.encode()) <= 64, callback
+            history_offset = timed(lambda: conn.execute(OFFSET_HISTORY, (HEAVY_USER, PER_PAGE, offset)).fetchall(), args.repeat)
+            history_keyset = timed(lambda: storage.get_user_sms_page(HEAVY_USER, PER_PAGE + 1, log_cursor), args.repeat)
+            users_offset = timed(lambda: conn.execute(OFFSET_USERS, (PER_PAGE, offset)).fetchall(), args.repeat)
+            users_keyset = timed(lambda: storage.get_users_page(PER_PAGE + 1, user_cursor), args.repeat)
+            print(f"{page:>8}{history_offset['p50'] * 1000:>16.3f}{history_keyset['p50'] * 1000:>16.3f}{users_offset['p50'] * 1000:>14.3f}{users_keyset['p50'] * 1000:>14.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
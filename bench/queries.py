@@ -0,0 +1,162 @@
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from load import summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# --- sms_log Query Benchmark ---
+# Seeds a database in the original schema (no indexes, no `day` column) with
+# millions of sms_log rows, times the original hot queries, migrates the file
+# to the current schema and times them again two ways: the indexed range
+# queries on sms_log, and the storage functions the bot calls today (which
+# read the materialized counters where they can).
+#
+# Usage (from the repository root):
+#   python bench/queries.py --rows 2000000 --users 20000
+#   python bench/queries.py --db seeded.db --keep   # reuse a seeded copy
+
+BASELINE = {
+    'number daily cap': ("SELECT COUNT(*) FROM sms_log WHERE user_id = ? AND phone_number = ? AND DATE(timestamp) = ?", lambda s: (s.user_id, s.phone_number, s.day)),
+    'profile lifetime': ("SELECT COUNT(*) FROM sms_log WHERE user_id = ?", lambda s: (s.user_id,)),
+    'history page 1': ("SELECT phone_number, timestamp FROM sms_log WHERE user_id = ? ORDER BY timestamp DESC LIMIT 10 OFFSET 0", lambda s: (s.user_id,)),
+    'stats today': ("SELECT COUNT(*) FROM sms_log WHERE DATE(timestamp) = ?", lambda s: (s.day,)),
+    'stats total': ("SELECT COUNT(*) FROM sms_log", lambda s: ()),
+}
+
+INDEXED = {
+    'number daily cap': ("SELECT COUNT(*) FROM sms_log WHERE user_id = ? AND phone_number = ? AND day = ?", lambda s: (s.user_id, s.phone_number, s.day)),
+    'profile lifetime': ("SELECT COUNT(*) FROM sms_log WHERE user_id = ?", lambda s: (s.user_id,)),
+    'history page 1': ("SELECT phone_number, timestamp, log_id FROM sms_log WHERE user_id = ? ORDER BY timestamp DESC, log_id DESC LIMIT 10", lambda s: (s.user_id,)),
+    'stats today': ("SELECT COUNT(*) FROM sms_log WHERE timestamp >= ? AND timestamp < ?", lambda s: (s.day, s.next_day)),
+    'stats total': ("SELECT COUNT(*) FROM sms_log", lambda s: ()),
+}
+
+
+class Sample:
+    def __init__(self, user_id, phone_number, day):
+        self.user_id = user_id
+        self.phone_number = phone_number
+        self.day = day
+        self.next_day = str(datetime.date.fromisoformat(day) + datetime.timedelta(days=1))
+
+
+def seed(path, rows, users, days):
+    import migrations
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("BEGIN")
+    migrations.MIGRATIONS[0](conn)
+    conn.execute("PRAGMA user_version = 1")
+    conn.executemany("INSERT INTO users (user_id, first_name, username) VALUES (?, ?, ?)", ((user_id, f"user{user_id}", f"user{user_id}") for user_id in range(1, users + 1)))
+    conn.execute("COMMIT")
+    # Rows are appended in time order, as the bot writes them.
+    start = datetime.datetime.now() - datetime.timedelta(days=days)
+    step = days * 86400 / rows
+    batch = 100000
+    for offset in range(0, rows, batch):
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO sms_log (user_id, phone_number, message, timestamp) VALUES (?, ?, 'bench message', ?)",
+            ((user_id, f"017{user_id:05d}{random.randrange(3):03d}", (start + datetime.timedelta(seconds=index * step)).isoformat())
+             for user_id, index in ((random.randint(1, users), index) for index in range(offset, min(rows, offset + batch)))))
+        conn.execute("COMMIT")
+    conn.close()
+
+
+def samples(path, count):
+    conn = sqlite3.connect(path)
+    last = conn.execute("SELECT MAX(log_id) FROM sms_log").fetchone()[0]
+    rows = [conn.execute("SELECT user_id, phone_number, substr(timestamp, 1, 10) FROM sms_log WHERE log_id = ?", (random.randint(1, last),)).fetchone() for _ in range(count)]
+    conn.close()
+    return [Sample(*row) for row in rows]
+
+
+def time_sql(path, queries, picks, repeat):
+    conn = sqlite3.connect(path)
+    results = {}
+    for name, (sql, params) in queries.items():
+        timings = []
+        for sample in (picks * repeat)[:repeat]:
+            started = time.perf_counter()
+            conn.execute(sql, params(sample)).fetchall()
+            timings.append(time.perf_counter() - started)
+        results[name] = summarize(timings)
+    conn.close()
+    return results
+
+
+def time_storage(picks, repeat):
+    import storage
+    calls = {
+        'number daily cap': lambda s: storage.count_number_sms_on(s.user_id, s.phone_number, s.day),
+        'profile lifetime': lambda s: storage.count_user_sms(s.user_id),
+        'history page 1': lambda s: storage.get_user_sms_page(s.user_id, 11),
+        'stats today': lambda s: storage.count_sms_on(s.day),
+        'stats total': lambda s: storage.count_all_sms(),
+    }
+    results = {}
+    for name, call in calls.items():
+        timings = []
+        for sample in (picks * repeat)[:repeat]:
+            started = time.perf_counter()
+            call(sample)
+            timings.append(time.perf_counter() - started)
+        results[name] = summarize(timings)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the sms_log hot queries before and after the schema migrations")
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=20, help="timed runs per query")
+    parser.add_argument('--db', help="seeded baseline database to reuse (created if missing)")
+    parser.add_argument('--keep', action='store_true', help="keep the working directory")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='smsbot-queries-')
+    path = os.path.join(workdir, 'sms_bot.db')
+    try:
+        if args.db and os.path.exists(args.db):
+            shutil.copyfile(args.db, path)
+        else:
+            started = time.perf_counter()
+            seed(path, args.rows, args.users, args.days)
+            print(f"seeded {args.rows} rows for {args.users} users in {time.perf_counter() - started:.1f}s")
+            if args.db:
+                shutil.copyfile(path, args.db)
+        picks = samples(path, args.repeat)
+        before = time_sql(path, BASELINE, picks, args.repeat)
+
+        os.environ['DB_PATH'] = path
+        import storage
+        started = time.perf_counter()
+        storage.setup_database()
+        print(f"migrated in {time.perf_counter() - started:.1f}s")
+        indexed = time_sql(path, INDEXED, picks, args.repeat)
+        current = time_storage(picks, args.repeat)
+
+        print(f"{'query':<18}{'baseline p50':>14}{'indexed p50':>13}{'current p50':>13}{'baseline p99':>14}{'current p99':>13}  (ms)")
+        for name in BASELINE:
+            print(f"{name:<18}{before[name]['p50'] * 1000:>14.3f}{indexed[name]['p50'] * 1000:>13.3f}{current[name]['p50'] * 1000:>13.3f}"
+                  f"{before[name]['p99'] * 1000:>14.3f}{current[name]['p99'] * 1000:>13.3f}")
+    finally:
+        if args.keep:
+            print(f"kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from fakes import FakeGateway, FakeTelegram
+from load import FIRST_USER_ID, REPLY_PREDICATES, UPDATE_MIX, LoadGenerator
+from run import BOT_TOKEN, REPO_ROOT, bot_env, free_port, server_command, stop_server, wait_until_ready
+
+# --- Webhook Replay Harness ---
+# Builds a fixed stream of updates (the load generator's mix, spread over a
+# set of users) and replays it against the webhook open-loop: `senders`
+# threads POST as fast as the webhook acks, and a `duplicates` fraction of
+# updates is posted a second time, the way Telegram redelivers after a
+# timeout. For each UPDATE_WORKERS value it boots a fresh bot and reports:
+#   * acks per second, i.e. how fast the webhook takes updates off the wire;
+#   * processed per second: unique updates answered on the fake Bot API,
+#     from the first POST until the last answer;
+#   * redeliveries acked, and the number of updates answered, which should
+#     equal the unique updates.
+#
+# Usage (from the repository root):
+#   python bench/replay.py --updates 5000 --duplicates 0.1 --workers 1,4,8,16
+
+
+class Replay:
+    def __init__(self, webhook_url, telegram, updates, duplicates, senders, reply_timeout):
+        self.webhook_url = webhook_url
+        self.telegram = telegram
+        self.duplicates = duplicates
+        self.senders = senders
+        self.reply_timeout = reply_timeout
+        self.headers = {'Content-Type': 'application/json'}
+        # (kind, chat_id, update); built up front so the senders only POST.
+        self.stream = updates
+        self._lock = threading.Lock()
+        self._next = 0
+        self.acks = 0
+        self.redeliveries = 0
+        self.errors = 0
+        self.answered = 0
+        self.last_answer = None
+        self.all_answered = threading.Event()
+
+    def _track(self, kind, chat_id, update):
+        # Counts the update once, for whichever of its answers comes first.
+        query_id = update.get('callback_query', {}).get('id')
+
+        def on_answer(method, params, result):
+            with self._lock:
+                if on_answer.done:
+                    return
+                on_answer.done = True
+                self.answered += 1
+                self.last_answer = time.perf_counter()
+                if self.answered == len(self.stream):
+                    self.all_answered.set()
+            self.telegram.cancel(chat_id, on_answer)
+            if query_id:
+                self.telegram.cancel(query_id, on_answer)
+        on_answer.done = False
+        self.telegram.expect(chat_id, on_answer, REPLY_PREDICATES[kind])
+        if query_id:
+            self.telegram.expect(query_id, on_answer)
+
+    def _take(self):
+        with self._lock:
+            if self._next >= len(self.stream):
+                return None
+            self._next += 1
+            return self.stream[self._next - 1]
+
+    def _post(self, session, body):
+        try:
+            ok = session.post(self.webhook_url, data=body, headers=self.headers, timeout=self.reply_timeout).status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        with self._lock:
+            self.acks += ok
+            self.errors += not ok
+
+    def _sender(self):
+        session = requests.Session()
+        while True:
+            item = self._take()
+            if item is None:
+                return
+            _, _, update = item
+            body = json.dumps(update)
+            self._post(session, body)
+            if random.random() < self.duplicates:
+                self._post(session, body)
+                with self._lock:
+                    self.redeliveries += 1
+
+    def run(self):
+        for kind, chat_id, update in self.stream:
+            self._track(kind, chat_id, update)
+        senders = [threading.Thread(target=self._sender, daemon=True) for _ in range(self.senders)]
+        self.started = time.perf_counter()
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join()
+        self.acked = time.perf_counter()
+        self.all_answered.wait(self.reply_timeout)
+
+    def report(self):
+        with self._lock:
+            ack_seconds = self.acked - self.started
+            answer_seconds = (self.last_answer or self.acked) - self.started
+            return {
+                'updates': len(self.stream),
+                'redeliveries': self.redeliveries,
+                'http_errors': self.errors,
+                'acks_per_second': self.acks / ack_seconds if ack_seconds else 0.0,
+                'answered': self.answered,
+                'processed_per_second': self.answered / answer_seconds if answer_seconds else 0.0,
+            }
+
+
+def build_stream(count, users):
+    # The load generator's mix; admin updates all come from admin 1.
+    builder = LoadGenerator(None, None, concurrency=1)
+    kinds = [kind for kind, _ in UPDATE_MIX]
+    weights = [weight for _, weight in UPDATE_MIX]
+    stream = []
+    for _ in range(count):
+        kind = random.choices(kinds, weights)[0]
+        chat_id, update = builder.build(kind, FIRST_USER_ID + random.randrange(users), 1)
+        stream.append((kind, chat_id, update))
+    return stream
+
+
+def run_workers(workers, args):
+    telegram = FakeTelegram(latency=args.telegram_latency, jitter=args.telegram_latency / 2).start()
+    gateway = FakeGateway(latency=args.gateway_latency, jitter=args.gateway_latency / 2).start()
+    workdir = tempfile.mkdtemp(prefix='smsbot-replay-')
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = bot_env(telegram, gateway, base_url, workdir, [1], [f"UPDATE_WORKERS={workers}"] + args.env)
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(server_command(args.config, port), cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_until_ready(base_url, process)
+        replay = Replay(f"{base_url}/{BOT_TOKEN}", telegram, build_stream(args.updates, args.users), args.duplicates, args.senders, args.timeout)
+        replay.run()
+        report = replay.report()
+        report['workers'] = workers
+        return report
+    finally:
+        stop_server(process)
+        log.close()
+        telegram.stop()
+        gateway.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a fixed update stream against the webhook and report throughput")
+    parser.add_argument('--updates', type=int, default=5000, help="unique updates in the stream")
+    parser.add_argument('--users', type=int, default=500, help="users the updates are spread over")
+    parser.add_argument('--duplicates', type=float, default=0.1, help="fraction of updates posted twice")
+    parser.add_argument('--workers', default='1,4,8,16', help="comma-separated UPDATE_WORKERS values")
+    parser.add_argument('--config', default='1x8', help="gunicorn WORKERSxTHREADS, or 'dev'")
+    parser.add_argument('--senders', type=int, default=16, help="threads posting updates")
+    parser.add_argument('--telegram-latency', type=float, default=0.05, help="seconds added to every Bot API call")
+    parser.add_argument('--gateway-latency', type=float, default=0.2, help="seconds added to every gateway call")
+    parser.add_argument('--timeout', type=float, default=300.0, help="max seconds to wait for every update to be answered")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help="extra environment for the bot")
+    args = parser.parse_args(argv)
+
+    print(f"{args.updates} updates over {args.users} users, {args.duplicates:.0%} redelivered, gunicorn {args.config}:")
+    print(f"   {'workers':>7}{'acks/s':>10}{'processed/s':>13}{'answered':>14}{'redelivered':>13}{'errors':>8}")
+    for workers in (int(value) for value in args.workers.split(',')):
+        report = run_workers(workers, args)
+        print(f"   {report['workers']:>7}{report['acks_per_second']:>10.0f}{report['processed_per_second']:>13.1f}"
+              f"{str(report['answered']) + '/' + str(report['updates']):>14}{report['redeliveries']:>13}{report['http_errors']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
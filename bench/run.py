@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from fakes import FakeGateway, FakeTelegram
+from load import LoadGenerator
+
+# --- Benchmark Runner ---
+# For each server configuration this script:
+#   * starts a fresh fake Bot API and fake gateway;
+#   * boots the bot under gunicorn on a fresh database;
+#   * drives it with the load generator;
+#   * waits for queued SMS to drain;
+#   * reports latency, throughput, outbound call counts and database size.
+#
+# Usage (from the repository root):
+#   python bench/run.py --configs 1x1,1x8,2x8 --duration 30
+#   python bench/run.py --json after.json --baseline before.json
+# A config is WORKERSxTHREADS for gunicorn; "dev" runs Flask's threaded
+# development server instead, for machines without gunicorn.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_TOKEN = "123456:bench"
+CHANNEL_ID = "@bench_channel"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(config, port):
+    if config == 'dev':
+        return [sys.executable, '-c', f"import main; main.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    workers, threads = config.split('x')
+    return [sys.executable, '-m', 'gunicorn', 'main:app', '--bind', f'127.0.0.1:{port}', '--workers', workers, '--threads', threads, '--log-level', 'warning']
+
+
+def wait_until_ready(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/metrics", timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def wait_for_drain(gateway, timeout):
+    # Queued SMS keep going out after the load stops; wait until the gateway
+    # has been quiet for a couple of seconds.
+    deadline = time.monotonic() + timeout
+    last, quiet_since = None, time.monotonic()
+    while time.monotonic() < deadline:
+        total = sum(gateway.calls.values())
+        if total != last:
+            last, quiet_since = total, time.monotonic()
+        elif time.monotonic() - quiet_since >= 2:
+            return
+        time.sleep(0.25)
+
+
+def database_size(db_path):
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+
+def bot_env(telegram, gateway, base_url, workdir, admin_ids, extra=()):
+    env = dict(os.environ)
+    env.update({
+        'BOT_TOKEN': BOT_TOKEN,
+        'CHANNEL_ID': CHANNEL_ID,
+        'ADMIN_IDS': ','.join(str(admin_id) for admin_id in admin_ids),
+        'SMS_API_URL': f"{gateway.url}/send",
+        'WEBHOOK_URL': base_url,
+        'TELEGRAM_API_URL': telegram.url,
+        'DB_PATH': os.path.join(workdir, 'sms_bot.db'),
+        'ARCHIVE_DIR': os.path.join(workdir, 'archive'),
+    })
+    for item in extra:
+        key, _, value = item.partition('=')
+        env[key] = value
+    return env
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_config(config, args):
+    telegram = FakeTelegram(latency=args.telegram_latency, jitter=args.telegram_latency / 2).start()
+    gateway = FakeGateway(latency=args.gateway_latency, jitter=args.gateway_latency / 2, error_rate=args.gateway_error_rate).start()
+    workdir = tempfile.mkdtemp(prefix='smsbot-bench-')
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    generator = LoadGenerator(f"{base_url}/{BOT_TOKEN}", telegram, concurrency=args.concurrency, users_per_client=args.users_per_client, duration=args.duration)
+    env = bot_env(telegram, gateway, base_url, workdir, generator.admin_ids(), args.env)
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(server_command(config, port), cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_until_ready(base_url, process)
+        generator.run()
+        wait_for_drain(gateway, args.drain)
+        report = generator.report()
+        report['config'] = config
+        report['telegram_calls'] = dict(telegram.calls)
+        report['gateway_calls'] = dict(gateway.calls)
+        report['db_bytes'] = database_size(env['DB_PATH'])
+        return report
+    finally:
+        stop_server(process)
+        log.close()
+        telegram.stop()
+        gateway.stop()
+        if args.keep:
+            print(f"  kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def ms(seconds):
+    return f"{seconds * 1000:7.1f}"
+
+
+def print_report(report):
+    print(f"== {report['config']}: {report['updates']} updates in {report['elapsed']:.1f}s = {report['throughput']:.1f} updates/s, "
+          f"{report['http_errors']} HTTP errors, DB {report['db_bytes'] / 1024:.0f} KiB")
+    print(f"   {'kind':<10}{'n':>7}{'ack p50':>10}{'ack p99':>10}{'reply p50':>11}{'reply p99':>11}{'timeouts':>10}")
+    for kind in report['reply']:
+        ack, reply = report['ack'][kind], report['reply'][kind]
+        print(f"   {kind:<10}{ack['count']:>7}{ms(ack['p50']):>10}{ms(ack['p99']):>10}{ms(reply['p50']):>11}{ms(reply['p99']):>11}{report['timeouts'][kind]:>10}")
+    delivery = report['delivery']
+    print(f"   sms delivered: {delivery['count']} (p50 {ms(delivery['p50']).strip()} ms, p99 {ms(delivery['p99']).strip()} ms)")
+    print(f"   telegram calls: {report['telegram_calls']}")
+    print(f"   gateway calls: {report['gateway_calls']}")
+
+
+def compare(reports, baseline, tolerance):
+    # Returns the number of regressions beyond `tolerance` (a fraction).
+    previous = {report['config']: report for report in baseline}
+    regressions = 0
+    for report in reports:
+        old = previous.get(report['config'])
+        if not old:
+            continue
+        checks = [
+            ('throughput', old['throughput'], report['throughput'], False),
+            ('reply p99', old['reply_all']['p99'], report['reply_all']['p99'], True),
+            ('sms delivery p99', old['delivery']['p99'], report['delivery']['p99'], True),
+        ]
+        for name, before, after, lower_is_better in checks:
+            if not before:
+                continue
+            change = (after - before) / before
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            regressions += worse
+            print(f"   {report['config']} {name}: {before:.4g} -> {after:.4g} ({change:+.0%}){'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the bot against local Telegram and gateway stand-ins")
+    parser.add_argument('--configs', default='1x1,1x8,2x8', help="comma-separated WORKERSxTHREADS gunicorn settings, or 'dev'")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of load per config")
+    parser.add_argument('--concurrency', type=int, default=16, help="virtual clients, each with one update in flight")
+    parser.add_argument('--users-per-client', type=int, default=50)
+    parser.add_argument('--telegram-latency', type=float, default=0.05, help="seconds added to every Bot API call")
+    parser.add_argument('--gateway-latency', type=float, default=0.2, help="seconds added to every gateway call")
+    parser.add_argument('--gateway-error-rate', type=float, default=0.0, help="fraction of gateway calls answering 500")
+    parser.add_argument('--drain', type=float, default=60.0, help="max seconds to wait for queued SMS after the load stops")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help="extra environment for the bot, e.g. UPDATE_WORKERS=8")
+    parser.add_argument('--json', help="write the reports to this file")
+    parser.add_argument('--baseline', help="compare with reports from an earlier --json run")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative regression against the baseline")
+    parser.add_argument('--keep', action='store_true', help="keep each run's database and server log")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for config in args.configs.split(','):
+        report = run_config(config.strip(), args)
+        print_report(report)
+        reports.append(report)
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(reports, out, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            return 1 if compare(reports, json.load(baseline), args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
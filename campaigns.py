@@ -0,0 +1,221 @@
+import datetime
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import storage
+from limiter import LimitExceeded
+
+# --- Bulk SMS Campaigns ---
+# An uploaded number list is streamed line by line into `campaign_numbers`
+# (the primary key de-duplicates), so memory use does not depend on the file
+# size. A running campaign walks its queued numbers in keyset order and keeps
+# at most `concurrency` gateway calls in flight. The campaign row holds a
+# lease like `pending_sms`, so a campaign left running by a dead process is
+# picked up again after a restart. A number's send-limit hold is taken in the
+# transaction that marks it 'sending' and released in the one that records
+# its result, or when it is written off as failed after a crash.
+
+NUMBER_SEPARATORS = re.compile(r'[,;\s]+')
+INSERT_BATCH = 500
+FETCH_BATCH = 200
+
+
+def normalize_number(token):
+    number = token.strip().strip('\ufeff"\'').replace('-', '')
+    if number.startswith('+'):
+        number = number[1:]
+    if number.isdigit() and 10 <= len(number) <= 15:
+        return number
+    return None
+
+
+class CampaignRunner:
+    def __init__(self, send, reserve, release, on_progress, concurrency=4, progress_interval=3.0, lease_seconds=120):
+        # send(campaign, phone_number) -> delivered
+        # reserve(user_id, phone_number) -> hold_id, or raises LimitExceeded
+        # release(hold_id) frees the hold, inside the caller's transaction
+        # on_progress(campaign, final) updates the campaign's progress message
+        self.send = send
+        self.reserve = reserve
+        self.release = release
+        self.on_progress = on_progress
+        self.concurrency = max(1, concurrency)
+        self.progress_interval = progress_interval
+        self.lease_seconds = lease_seconds
+
+    # --- Building a campaign ---
+    @metrics.timed_query
+    def create(self, user_id, first_name, chat_id):
+        cur = storage.execute("INSERT INTO campaigns (user_id, first_name, chat_id, created_at) VALUES (?, ?, ?, ?)", (user_id, first_name, chat_id, datetime.datetime.now().isoformat()))
+        return cur.lastrowid
+
+    @metrics.timed_query
+    def add_numbers(self, campaign_id, lines):
+        # `lines` may be any iterable of text lines (e.g. a streamed download).
+        # Returns (added, invalid, duplicates).
+        valid = invalid = added = 0
+        batch = []
+
+        def flush():
+            nonlocal added
+            with storage.transaction() as conn:
+                before = conn.total_changes
+                conn.executemany("INSERT OR IGNORE INTO campaign_numbers (campaign_id, phone_number) VALUES (?, ?)", batch)
+                added += conn.total_changes - before
+            batch.clear()
+
+        for line in lines:
+            for token in NUMBER_SEPARATORS.split(line):
+                if not token:
+                    continue
+                number = normalize_number(token)
+                if number is None:
+                    # Only count tokens that look like an attempt at a number,
+                    # not CSV headers or name columns.
+                    if any(ch.isdigit() for ch in token):
+                        invalid += 1
+                    continue
+                valid += 1
+                batch.append((campaign_id, number))
+                if len(batch) >= INSERT_BATCH:
+                    flush()
+        if batch:
+            flush()
+        storage.execute("UPDATE campaigns SET total = total + ? WHERE campaign_id = ?", (added, campaign_id))
+        return added, invalid, valid - added
+
+    @metrics.timed_query
+    def get(self, campaign_id):
+        row = storage.fetch_one("SELECT * FROM campaigns WHERE campaign_id = ?", (campaign_id,))
+        return dict(row) if row else None
+
+    @metrics.timed_query
+    def discard(self, campaign_id):
+        with storage.transaction() as conn:
+            conn.execute("DELETE FROM campaign_numbers WHERE campaign_id = ?", (campaign_id,))
+            conn.execute("DELETE FROM campaigns WHERE campaign_id = ?", (campaign_id,))
+
+    @metrics.timed_query
+    def start(self, campaign_id, message, progress_message_id):
+        storage.execute("UPDATE campaigns SET message = ?, progress_message_id = ?, status = 'running', claimed_at = ? WHERE campaign_id = ?", (message, progress_message_id, time.time(), campaign_id))
+        self._spawn(campaign_id)
+
+    # --- Resuming after a restart ---
+    @metrics.timed_query
+    def _claim_orphan(self):
+        now = time.time()
+        with storage.transaction() as conn:
+            row = conn.execute("SELECT campaign_id FROM campaigns WHERE status = 'running' AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY campaign_id LIMIT 1", (now - self.lease_seconds,)).fetchone()
+            if not row:
+                return None
+            campaign_id = row[0]
+            conn.execute("UPDATE campaigns SET claimed_at = ? WHERE campaign_id = ?", (now, campaign_id))
+            # Numbers that were mid-send when the old process died may or may
+            # not have gone out; count them as failed rather than risk a resend.
+            for (hold_id,) in conn.execute("SELECT hold_id FROM campaign_numbers WHERE campaign_id = ? AND status = 'sending'", (campaign_id,)).fetchall():
+                self.release(hold_id)
+            lost = conn.execute("UPDATE campaign_numbers SET status = 'failed' WHERE campaign_id = ? AND status = 'sending'", (campaign_id,)).rowcount
+            conn.execute("UPDATE campaigns SET failed = failed + ? WHERE campaign_id = ?", (lost, campaign_id))
+        return campaign_id
+
+    def start_watcher(self, interval=30):
+        def watch():
+            while True:
+                try:
+                    campaign_id = self._claim_orphan()
+                    while campaign_id:
+                        self._spawn(campaign_id)
+                        campaign_id = self._claim_orphan()
+                except Exception as e:
+                    print(f"Campaign watcher error: {e}")
+                time.sleep(interval)
+        threading.Thread(target=watch, name="campaign-watcher", daemon=True).start()
+
+    # --- Running ---
+    def _spawn(self, campaign_id):
+        threading.Thread(target=self._run, args=(campaign_id,), name=f"campaign-{campaign_id}", daemon=True).start()
+
+    def _heartbeat(self, campaign_id, last_progress, final=False):
+        now = time.monotonic()
+        if not final and now - last_progress < self.progress_interval:
+            return last_progress
+        storage.execute("UPDATE campaigns SET claimed_at = ? WHERE campaign_id = ?", (time.time(), campaign_id))
+        try:
+            self.on_progress(self.get(campaign_id), final)
+        except Exception as e:
+            print(f"Campaign {campaign_id} progress update failed: {e}")
+        return now
+
+    @metrics.timed_query
+    def _finish_number(self, campaign_id, phone_number, user_id, message, delivered, hold_id):
+        status = 'sent' if delivered else 'failed'
+        with storage.transaction() as conn:
+            if delivered:
+                storage.record_sms(user_id, phone_number, message, datetime.datetime.now())
+            conn.execute("UPDATE campaign_numbers SET status = ? WHERE campaign_id = ? AND phone_number = ?", (status, campaign_id, phone_number))
+            conn.execute(f"UPDATE campaigns SET {status} = {status} + 1 WHERE campaign_id = ?", (campaign_id,))
+            self.release(hold_id)
+
+    def _run(self, campaign_id):
+        campaign = self.get(campaign_id)
+        user_id, message = campaign['user_id'], campaign['message']
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"campaign-{campaign_id}")
+        slots = threading.Semaphore(self.concurrency)
+        last_progress = 0.0
+        stop_reason = None
+
+        def send_one(phone_number, hold_id):
+            delivered = False
+            try:
+                try:
+                    delivered = self.send(campaign, phone_number)
+                except Exception as e:
+                    print(f"Campaign {campaign_id} send to {phone_number} failed: {e}")
+                # The gateway has answered; keep trying to record it rather
+                # than leave the number 'sending' with its hold taken.
+                while True:
+                    try:
+                        self._finish_number(campaign_id, phone_number, user_id, message, delivered, hold_id)
+                        break
+                    except sqlite3.Error as e:
+                        print(f"Campaign {campaign_id} could not record {phone_number}, retrying: {e}")
+                        time.sleep(1)
+            finally:
+                slots.release()
+
+        last_key = ''
+        while stop_reason is None:
+            batch = storage.fetch_all("SELECT phone_number FROM campaign_numbers WHERE campaign_id = ? AND status = 'queued' AND phone_number > ? ORDER BY phone_number LIMIT ?", (campaign_id, last_key, FETCH_BATCH))
+            if not batch:
+                break
+            for row in batch:
+                phone_number = row[0]
+                while not slots.acquire(timeout=self.progress_interval):
+                    last_progress = self._heartbeat(campaign_id, last_progress)
+                try:
+                    with storage.transaction() as conn:
+                        hold_id = self.reserve(user_id, phone_number)
+                        conn.execute("UPDATE campaign_numbers SET status = 'sending', hold_id = ? WHERE campaign_id = ? AND phone_number = ?", (hold_id, campaign_id, phone_number))
+                except LimitExceeded as e:
+                    slots.release()
+                    if e.policy != 'number':
+                        stop_reason = 'limited'
+                        break
+                    with storage.transaction() as conn:
+                        conn.execute("UPDATE campaign_numbers SET status = 'skipped' WHERE campaign_id = ? AND phone_number = ?", (campaign_id, phone_number))
+                        conn.execute("UPDATE campaigns SET skipped = skipped + 1 WHERE campaign_id = ?", (campaign_id,))
+                    continue
+                executor.submit(send_one, phone_number, hold_id)
+                last_progress = self._heartbeat(campaign_id, last_progress)
+            last_key = batch[-1][0]
+        # Wait for the last in-flight sends.
+        for _ in range(self.concurrency):
+            while not slots.acquire(timeout=self.progress_interval):
+                last_progress = self._heartbeat(campaign_id, last_progress)
+        executor.shutdown(wait=True)
+        storage.execute("UPDATE campaigns SET status = ? WHERE campaign_id = ?", (stop_reason or 'done', campaign_id))
+        self._heartbeat(campaign_id, last_progress, final=True)
@@ -0,0 +1,78 @@
+# --- Materialized SMS Counters ---
+# Totals that handlers used to COUNT(*) from sms_log on every view. They are
+# bumped in the same transaction that inserts the log row, and can always be
+# rebuilt with rebuild() from the raw log plus `sms_log_rollup`, which holds
+# per-user daily counts for rows the retention job has archived.
+
+COUNTER_TABLES = ('user_sms_totals', 'user_daily_sms', 'number_daily_sms', 'daily_sms', 'global_counters')
+
+
+def bump_global(conn, name, amount=1):
+    conn.execute("INSERT INTO global_counters (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", (name, amount))
+
+
+def record_sms(conn, user_id, phone_number, day):
+    # Must run inside the transaction that inserts the sms_log row.
+    conn.execute("INSERT INTO user_sms_totals (user_id, total) VALUES (?, 1) ON CONFLICT (user_id) DO UPDATE SET total = total + 1", (user_id,))
+    conn.execute("INSERT INTO user_daily_sms (user_id, day, count) VALUES (?, ?, 1) ON CONFLICT (user_id, day) DO UPDATE SET count = count + 1", (user_id, day))
+    conn.execute("INSERT INTO number_daily_sms (user_id, phone_number, day, count) VALUES (?, ?, ?, 1) ON CONFLICT (user_id, phone_number, day) DO UPDATE SET count = count + 1", (user_id, phone_number, day))
+    conn.execute("INSERT INTO daily_sms (day, count) VALUES (?, 1) ON CONFLICT (day) DO UPDATE SET count = count + 1", (day,))
+    bump_global(conn, 'sms_total')
+
+
+# Per-user daily counts over the raw log and the archived rollup together.
+USER_DAY_COUNTS = '''
+    SELECT user_id, day, SUM(n) AS n FROM (
+        SELECT user_id, day, COUNT(*) AS n FROM sms_log GROUP BY user_id, day
+        UNION ALL
+        SELECT user_id, day, count FROM sms_log_rollup
+    ) GROUP BY user_id, day'''
+
+
+def rebuild(conn):
+    # number_daily_sms only backs the per-number daily cap, so it is rebuilt
+    # from the raw log alone; archived days have no per-number detail.
+    for table in COUNTER_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute(f"INSERT INTO user_sms_totals (user_id, total) SELECT user_id, SUM(n) FROM ({USER_DAY_COUNTS}) GROUP BY user_id")
+    conn.execute(f"INSERT INTO user_daily_sms (user_id, day, count) {USER_DAY_COUNTS}")
+    conn.execute("INSERT INTO number_daily_sms (user_id, phone_number, day, count) SELECT user_id, phone_number, day, COUNT(*) FROM sms_log GROUP BY user_id, phone_number, day")
+    conn.execute(f"INSERT INTO daily_sms (day, count) SELECT day, SUM(n) FROM ({USER_DAY_COUNTS}) GROUP BY day")
+    conn.execute(f"INSERT INTO global_counters (name, value) SELECT 'sms_total', COALESCE(SUM(n), 0) FROM ({USER_DAY_COUNTS})")
+    conn.execute("INSERT INTO global_counters (name, value) SELECT 'users_total', COUNT(*) FROM users")
+
+
+# Each check yields rows where the materialized value and the log (raw rows
+# plus the archived rollup) disagree.
+CONSISTENCY_CHECKS = {
+    'user_sms_totals': f'''
+        SELECT l.user_id, l.n, t.total FROM (SELECT user_id, SUM(n) AS n FROM ({USER_DAY_COUNTS}) GROUP BY user_id) l
+        LEFT JOIN user_sms_totals t ON t.user_id = l.user_id WHERE t.total IS NOT l.n
+        UNION ALL
+        SELECT t.user_id, 0, t.total FROM user_sms_totals t
+        WHERE t.total != 0 AND NOT EXISTS (SELECT 1 FROM sms_log l WHERE l.user_id = t.user_id)
+        AND NOT EXISTS (SELECT 1 FROM sms_log_rollup r WHERE r.user_id = t.user_id)''',
+    'user_daily_sms': f'''
+        SELECT l.user_id, l.day, l.n, c.count FROM ({USER_DAY_COUNTS}) l
+        LEFT JOIN user_daily_sms c ON c.user_id = l.user_id AND c.day = l.day WHERE c.count IS NOT l.n''',
+    'number_daily_sms': '''
+        SELECT l.user_id, l.phone_number, l.day, l.n, c.count FROM (SELECT user_id, phone_number, day, COUNT(*) AS n FROM sms_log GROUP BY user_id, phone_number, day) l
+        LEFT JOIN number_daily_sms c ON c.user_id = l.user_id AND c.phone_number = l.phone_number AND c.day = l.day WHERE c.count IS NOT l.n''',
+    'daily_sms': f'''
+        SELECT l.day, l.n, c.count FROM (SELECT day, SUM(n) AS n FROM ({USER_DAY_COUNTS}) GROUP BY day) l
+        LEFT JOIN daily_sms c ON c.day = l.day WHERE c.count IS NOT l.n''',
+    'global_counters': f'''
+        SELECT 'sms_total', (SELECT COALESCE(SUM(n), 0) FROM ({USER_DAY_COUNTS})) AS n, (SELECT value FROM global_counters WHERE name = 'sms_total') AS v WHERE v IS NOT n
+        UNION ALL
+        SELECT 'users_total', (SELECT COUNT(*) FROM users) AS n, (SELECT value FROM global_counters WHERE name = 'users_total') AS v WHERE v IS NOT n''',
+}
+
+
+def check(conn):
+    # Returns {counter_table: [mismatched rows]}; empty when everything agrees.
+    problems = {}
+    for table, sql in CONSISTENCY_CHECKS.items():
+        rows = conn.execute(sql).fetchall()
+        if rows:
+            problems[table] = [tuple(row) for row in rows]
+    return problems
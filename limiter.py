@@ -0,0 +1,133 @@
+import datetime
+import json
+import threading
+import time
+import uuid
+
+import metrics
+import storage
+
+# --- Send Limiter ---
+# Every SMS reserves a slot in each policy before it is queued and releases
+# it once the result is recorded; a delivered SMS then counts through the
+# persisted counters instead. Each policy is a daily window per key (a user,
+# a user+number pair, or the whole bot).
+#
+# Reserved slots are rows in `send_holds`, one per policy, under a hold id
+# that the queued job or campaign number keeps. The check reads the persisted
+# counters plus the holds and inserts the new holds in one write transaction.
+# SQLite runs those one at a time across every gunicorn worker, so requests in
+# different processes cannot both take the last slot. Releasing deletes the
+# holds in the transaction that records the send, so a slot moves from held to
+# used in one step. Nothing lives in memory: a restart finds the holds of
+# still-queued work where it left them, and holds from past days are purged.
+#
+# TokenBucket paces calls to the gateway itself (messages per second). Its
+# state is a row in `rate_limits` as well, so every process sending through
+# the same database shares one rate instead of each sending at the full rate.
+
+
+class LimitExceeded(Exception):
+    def __init__(self, policy, limit):
+        super().__init__(f"{policy} limit of {limit} reached")
+        self.policy = policy
+        self.limit = limit
+
+
+class Policy:
+    def __init__(self, name, load):
+        # load(key, day) -> (used, limit): the persisted count for the window
+        # and the limit that applies to it (None for no limit). It runs inside
+        # the reserving transaction, so it must read through storage.
+        self.name = name
+        self.load = load
+
+
+class Reservation:
+    __slots__ = ('day', 'keys', 'hold_id')
+
+    def __init__(self, day, keys, hold_id=None):
+        # keys: ((policy_name, key), ...); hold_id is set by Limiter.reserve.
+        self.day = day
+        self.keys = keys
+        self.hold_id = hold_id
+
+
+class Limiter:
+    def __init__(self, policies, purge_interval=3600):
+        self.policies = {policy.name: policy for policy in policies}
+        self.purge_interval = purge_interval
+
+    def reservation(self, day=None, **keys):
+        # e.g. reservation(user=42, number=(42, '0171...'), service=None)
+        return Reservation(day or str(datetime.date.today()), tuple(keys.items()))
+
+    @metrics.timed_query
+    def reserve(self, reservation):
+        # Takes one slot in every policy or none; raises LimitExceeded naming
+        # the first policy that is full.
+        hold_id = uuid.uuid4().hex
+        holds = []
+        with storage.transaction() as conn:
+            for name, key in reservation.keys:
+                stored_key = json.dumps(key)
+                used, limit = self.policies[name].load(key, reservation.day)
+                if limit is not None:
+                    held = conn.execute("SELECT COUNT(*) FROM send_holds WHERE policy = ? AND key = ? AND day = ?", (name, stored_key, reservation.day)).fetchone()[0]
+                    if used + held >= limit:
+                        raise LimitExceeded(name, limit)
+                holds.append((hold_id, name, stored_key, reservation.day))
+            conn.executemany("INSERT INTO send_holds (hold_id, policy, key, day) VALUES (?, ?, ?, ?)", holds)
+        reservation.hold_id = hold_id
+        return reservation
+
+    @metrics.timed_query
+    def release(self, hold_id):
+        # Frees a reservation's slots, whether the send went out or not. Call
+        # it inside the transaction that records the result, so no reader
+        # sees the slot counted twice or not at all.
+        if hold_id:
+            storage.execute("DELETE FROM send_holds WHERE hold_id = ?", (hold_id,))
+
+    @metrics.timed_query
+    def purge(self):
+        storage.execute("DELETE FROM send_holds WHERE day < ?", (str(datetime.date.today()),))
+
+    def start(self):
+        def run():
+            while True:
+                try:
+                    self.purge()
+                except Exception as e:
+                    print(f"Limiter purge failed: {e}")
+                time.sleep(self.purge_interval)
+        threading.Thread(target=run, name="limiter-purge", daemon=True).start()
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, name='gateway'):
+        # rate: tokens per second; capacity: largest burst (defaults to rate).
+        # The row holds the time the next token is due (GCRA): each call
+        # takes the next slot in a write transaction, then sleeps until its
+        # turn outside it.
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.name = name
+        self._interval = 1 / rate
+        self._burst = (self.capacity - 1) * self._interval
+
+    @metrics.timed_query
+    def _take(self):
+        # Returns how long the caller must wait for its token.
+        now = time.time()
+        with storage.transaction() as conn:
+            row = conn.execute("SELECT next_at FROM rate_limits WHERE name = ?", (self.name,)).fetchone()
+            next_at = max(row[0], now) if row else now
+            conn.execute("INSERT INTO rate_limits (name, next_at) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET next_at = excluded.next_at", (self.name, next_at + self._interval))
+        return next_at - self._burst - now
+
+    def acquire(self):
+        # Blocks until a token is available.
+        wait = self._take()
+        if wait > 0:
+            time.sleep(wait)
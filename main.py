@@ -1,11 +1,27 @@
 import telebot
-import sqlite3
 import datetime
 import requests
 import os
 import sys
+import time
+import re
 from flask import Flask, request
 from telebot import types
+import hmac
+import json
+import storage
+import metrics
+import pagination
+from sms_queue import SmsDispatcher
+from sms_gateway import GatewayClient, CircuitOpenError
+from membership_cache import MembershipCache
+from notifications import AdminNotifier
+from campaigns import CampaignRunner
+from update_pool import OrderedUpdatePool, FULL
+from state_store import MemoryStateStore, SqliteStateStore, ADMIN
+import backup
+from retention import RetentionWorker
+from limiter import Limiter, LimitExceeded, Policy, TokenBucket
 
 # --- Environment Variables from Railway ---
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
@@ -13,69 +29,91 @@ CHANNEL_ID = os.environ.get("CHANNEL_ID")
 ADMIN_IDS_STR = os.environ.get("ADMIN_IDS")
 SMS_API_URL = os.environ.get("SMS_API_URL")
 WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+# Optional Bot API base URL, e.g. a local Bot API server or the bench/ stand-in.
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL")
+SMS_SENDER_WORKERS = int(os.environ.get("SMS_SENDER_WORKERS", "2"))
+BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", "4"))
+GATEWAY_POOL_SIZE = int(os.environ.get("GATEWAY_POOL_SIZE", str(max(SMS_SENDER_WORKERS + BULK_CONCURRENCY, 4))))
+MEMBERSHIP_POSITIVE_TTL = int(os.environ.get("MEMBERSHIP_POSITIVE_TTL", "300"))
+MEMBERSHIP_NEGATIVE_TTL = int(os.environ.get("MEMBERSHIP_NEGATIVE_TTL", "30"))
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", "4"))
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+# Bearer token for /metrics; without it only local, unproxied requests may scrape.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+STATE_STORE = os.environ.get("STATE_STORE", "sqlite")
+STATE_TTL = int(os.environ.get("STATE_TTL", "86400"))
+SMS_LOG_RETENTION_DAYS = int(os.environ.get("SMS_LOG_RETENTION_DAYS", "0"))
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+# Gateway contract: messages per second (0 = unpaced) and per day across all users (0 = no cap).
+GATEWAY_RATE = float(os.environ.get("GATEWAY_RATE", "0"))
+GATEWAY_DAILY_CAP = int(os.environ.get("GATEWAY_DAILY_CAP", "0"))
 
 # --- Essential Variable Check ---
 if not all([BOT_TOKEN, CHANNEL_ID, ADMIN_IDS_STR, SMS_API_URL, WEBHOOK_URL]):
     print("FATAL ERROR: A required variable was not found in Railway's 'Variables' tab. Please check for typos or missing variables.", file=sys.stderr)
     raise ValueError("Error: One or more required environment variables are not set in Railway.")
 
+if not WEBHOOK_SECRET:
+    print("WARNING: WEBHOOK_SECRET is not set. Anyone who knows the bot token can post updates to the webhook.", file=sys.stderr)
+
+# Update ordering, de-duplication and conversation state are kept per process.
+if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+    print("WARNING: WEB_CONCURRENCY is above 1. Run the bot as a single gunicorn worker and raise --threads or UPDATE_WORKERS instead.", file=sys.stderr)
+
 ADMIN_IDS = [int(admin_id.strip()) for admin_id in ADMIN_IDS_STR.split(',')]
 
-# --- Database Setup (Updated Schema) ---
-conn = sqlite3.connect('sms_bot.db', check_same_thread=False)
-cursor = conn.cursor()
-
-def setup_database():
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        first_name TEXT,
-        username TEXT,
-        sms_sent INTEGER DEFAULT 0,
-        last_sms_date TEXT,
-        bonus_sms INTEGER DEFAULT 0,
-        temp_admin_action TEXT,
-        current_action TEXT,
-        temp_data TEXT
-    )''')
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS sms_log (
-        log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        phone_number TEXT,
-        message TEXT,
-        timestamp TEXT
-    )''')
-    conn.commit()
-
-setup_database()
-bot = telebot.TeleBot(BOT_TOKEN)
+# --- Database Setup ---
+storage.setup_database()
+# Conversation state lives in memory; "sqlite" also writes it back in the background so it survives restarts.
+state_store = SqliteStateStore(ttl=STATE_TTL) if STATE_STORE == "sqlite" else MemoryStateStore(ttl=STATE_TTL)
+state_store.start()
+# Handlers run on the ordered update pool below, not telebot's own thread pool.
+bot = telebot.TeleBot(BOT_TOKEN, threaded=False)
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL.rstrip('/') + "/bot{0}/{1}"
+    telebot.apihelper.FILE_URL = TELEGRAM_API_URL.rstrip('/') + "/file/bot{0}/{1}"
+telebot.apihelper.CUSTOM_REQUEST_SENDER = metrics.timed_request_sender(telebot.apihelper.CUSTOM_REQUEST_SENDER or requests.Session().request)
 app = Flask(__name__)
 
 # --- Helper Functions ---
 def is_admin(user_id):
     return user_id in ADMIN_IDS
 
+MEMBER_STATUSES = ['member', 'administrator', 'creator']
+
+def fetch_channel_membership(user_id):
+    member = bot.get_chat_member(CHANNEL_ID, user_id)
+    return member.status in MEMBER_STATUSES
+
+membership_cache = MembershipCache(fetch_channel_membership, positive_ttl=MEMBERSHIP_POSITIVE_TTL, negative_ttl=MEMBERSHIP_NEGATIVE_TTL)
+
 def is_channel_member(user_id):
-    try:
-        member = bot.get_chat_member(CHANNEL_ID, user_id)
-        return member.status in ['member', 'administrator', 'creator']
-    except Exception:
-        return False
+    return membership_cache.get(user_id)
 
-def alert_admins(message, is_error=False):
-    prefix = "⚠️ **SMS পাঠানোর এরর লগ** ⚠️\n\n" if is_error else "🔔 **নতুন ব্যবহারকারীর নোটিফিকেশন** 🔔\n\n"
-    for admin_id in ADMIN_IDS:
-        try:
-            bot.send_message(admin_id, prefix + message, parse_mode="Markdown")
-        except Exception as e:
-            print(f"Failed to send notification to admin {admin_id}: {e}")
+def is_our_channel(chat):
+    if str(chat.id) == CHANNEL_ID:
+        return True
+    return bool(chat.username) and f"@{chat.username}".lower() == CHANNEL_ID.lower()
+
+ERROR_ALERT_PREFIX = "⚠️ **SMS পাঠানোর এরর লগ** ⚠️\n\n"
+NEW_USER_ALERT_PREFIX = "🔔 **নতুন ব্যবহারকারীর নোটিফিকেশন** 🔔\n\n"
+
+admin_notifier = AdminNotifier(lambda chat_id, text: bot.send_message(chat_id, text, parse_mode="Markdown"), ADMIN_IDS, ERROR_ALERT_PREFIX, NEW_USER_ALERT_PREFIX)
+admin_notifier.start()
+
+def alert_admins(message, is_error=False, status=None):
+    # Never blocks: delivery, coalescing and rate limiting happen on the notifier thread.
+    if is_error:
+        admin_notifier.notify_error(message, status)
+    else:
+        admin_notifier.notify_new_user(message)
 
 # --- Dynamic Command Menu ---
 def set_user_commands(user_id):
     user_commands = [
         types.BotCommand("start", "▶️ বট চালু/রিস্টার্ট করুন"),
         types.BotCommand("sms", "💬 <নম্বর> <মেসেজ> - SMS পাঠান"),
+        types.BotCommand("bulk", "📨 ফাইল থেকে একাধিক নম্বরে SMS পাঠান"),
         types.BotCommand("profile", "👤 আপনার প্রোফাইল ও ব্যালেন্স"),
         types.BotCommand("history", "📜 আপনার পাঠানো SMS-এর লগ"),
         types.BotCommand("referral", "🔗 আপনার রেফারেল লিঙ্ক"),
@@ -84,7 +122,8 @@ def set_user_commands(user_id):
     if is_admin(user_id):
         admin_commands = [
             types.BotCommand("admin", "🔑 অ্যাডমিন প্যানেল দেখুন"),
-            types.BotCommand("stats", "📊 বটের পরিসংখ্যান দেখুন")
+            types.BotCommand("stats", "📊 বটের পরিসংখ্যান দেখুন"),
+            types.BotCommand("export", "📤 SMS লগ এক্সপোর্ট করুন")
         ]
         user_commands.extend(admin_commands)
     bot.set_my_commands(commands=user_commands, scope=types.BotCommandScopeChat(user_id))
@@ -118,7 +157,7 @@ def admin_menu_keyboard():
     keyboard = types.InlineKeyboardMarkup(row_width=2)
     keyboard.add(types.InlineKeyboardButton("📊 বট Stats", callback_data="show_stats"), types.InlineKeyboardButton("👥 সব ইউজার দেখুন", callback_data="userlist_page_1"))
     keyboard.add(types.InlineKeyboardButton("🎁 বোনাস দিন", callback_data="prompt_set_bonus"), types.InlineKeyboardButton("🗒️ ইউজারের লগ", callback_data="prompt_user_sms"))
-    keyboard.add(types.InlineKeyboardButton("💾 ব্যাকআপ", callback_data="get_backup"))
+    keyboard.add(types.InlineKeyboardButton("💾 ব্যাকআপ", callback_data="get_backup"), types.InlineKeyboardButton("📨 বাল্ক SMS", callback_data="bulk_start"))
     keyboard.add(types.InlineKeyboardButton("🔙 মূল মেনু", callback_data="main_menu"))
     return keyboard
 
@@ -129,6 +168,7 @@ def back_to_main_menu_keyboard():
 
 # --- Command & Logic Handlers ---
 @bot.message_handler(commands=['start'])
+@metrics.timed_handler("start")
 def start_command(message):
     user_id = message.from_user.id
     user = message.from_user
@@ -136,23 +176,18 @@ def start_command(message):
     if not is_channel_member(user_id):
         bot.send_message(message.chat.id, "स्वागतम्!\n\nএই বটটি ব্যবহার করার জন্য আপনাকে অবশ্যই আমাদের চ্যানেলের সদস্য হতে হবে। অনুগ্রহ করে নিচের বাটনে ক্লিক করে চ্যানেলে যোগ দিন এবং তারপর আবার /start কমান্ড দিন।", reply_markup=force_join_keyboard())
         return
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    is_old_user = cursor.fetchone()
-    if not is_old_user:
-        cursor.execute("INSERT INTO users (user_id, first_name, username, last_sms_date) VALUES (?, ?, ?, ?)", (user_id, user.first_name, user.username, str(datetime.date.today())))
-        conn.commit()
+    if not storage.user_exists(user_id):
+        storage.create_user(user_id, user.first_name, user.username, str(datetime.date.today()))
         notification_message = f"**নাম:** {user.first_name}\n**ইউজারনেম:** @{user.username}\n**ইউজার আইডি:** `{user_id}`\nবটটি স্টার্ট করেছে।"
         alert_admins(notification_message)
     else:
-        cursor.execute("UPDATE users SET first_name = ?, username = ? WHERE user_id = ?", (user.first_name, user.username, user_id))
-        conn.commit()
+        storage.update_user_names(user_id, user.first_name, user.username)
     parts = message.text.split()
     if len(parts) > 1:
         try:
             referrer_id = int(parts[1])
-            if referrer_id != user_id:
-                cursor.execute("UPDATE users SET bonus_sms = bonus_sms + 3 WHERE user_id = ?", (referrer_id,))
-                conn.commit()
+            # Only a real user earns the bonus; the limiter reads it from the database.
+            if referrer_id != user_id and storage.add_bonus(referrer_id, 3):
                 bot.send_message(referrer_id, "অভিনন্দন! আপনার রেফারেল লিঙ্কে একজন নতুন সদস্য যোগ দিয়েছেন। আপনি ৩টি বোনাস SMS পেয়েছেন।")
         except (IndexError, ValueError):
             pass
@@ -160,6 +195,7 @@ def start_command(message):
     bot.send_message(message.chat.id, welcome_text, reply_markup=main_menu_keyboard(user_id))
 
 @bot.message_handler(commands=['sms'])
+@metrics.timed_handler("sms")
 def sms_command(message):
     user_id = message.from_user.id
     if not is_channel_member(user_id):
@@ -170,91 +206,263 @@ def sms_command(message):
     except ValueError:
         bot.reply_to(message, "❌ ভুল ফরম্যাট।\nসঠিক ফরম্যাট: `/sms <নম্বর> <মেসেজ>`")
         return
-    cursor.execute("SELECT sms_sent, last_sms_date, bonus_sms FROM users WHERE user_id = ?", (user_id,))
-    user_data = cursor.fetchone()
-    today = str(datetime.date.today())
-    if not user_data:
-        cursor.execute("INSERT INTO users (user_id, last_sms_date) VALUES (?, ?)", (user_id, today))
-        conn.commit()
-        sms_sent, bonus_sms = 0, 0
+    queue_sms(message, phone_number, sms_text)
+
+def queue_sms(message, phone_number, sms_text):
+    # Shared by /sms and the step-by-step "send SMS" flow.
+    user_id = message.from_user.id
+    if not storage.user_exists(user_id):
+        storage.create_user(user_id, message.from_user.first_name, message.from_user.username, str(datetime.date.today()))
+    try:
+        reservation = limiter.reserve(sms_reservation(user_id, phone_number))
+    except LimitExceeded as e:
+        bot.reply_to(message, limit_message(e))
+        return
+    try:
+        reply = bot.reply_to(message, f"⏳ '{phone_number}' নম্বরে আপনার SMS কিউতে রাখা হয়েছে।")
+        dispatcher.enqueue(user_id, message.from_user.first_name, message.chat.id, reply.message_id, phone_number, sms_text, reservation.hold_id)
+    except Exception:
+        limiter.release(reservation.hold_id)
+        raise
+
+# --- Send Limits ---
+DAILY_SMS_LIMIT = 10
+PER_NUMBER_DAILY_LIMIT = 4
+
+def load_user_quota(user_id, day):
+    sms_sent, bonus_sms = storage.get_quota(user_id, day)
+    return sms_sent, DAILY_SMS_LIMIT + bonus_sms
+
+def load_number_quota(key, day):
+    user_id, phone_number = key
+    return storage.count_number_sms_on(user_id, phone_number, day), PER_NUMBER_DAILY_LIMIT
+
+def load_service_quota(key, day):
+    return storage.count_sms_on(day), GATEWAY_DAILY_CAP or None
+
+limiter = Limiter([Policy('user', load_user_quota), Policy('number', load_number_quota), Policy('service', load_service_quota)])
+limiter.start()
+
+def sms_reservation(user_id, phone_number):
+    return limiter.reservation(user=user_id, number=(user_id, phone_number), service=None)
+
+def limit_message(error):
+    if error.policy == 'user':
+        return f"আপনি আপনার দৈনিক SMS পাঠানোর সীমা ({error.limit} টি) অতিক্রম করেছেন।"
+    if error.policy == 'number':
+        return "আপনি এই নম্বরে দিনে সর্বোচ্চ ৪টি SMS পাঠাতে পারবেন।"
+    return "আজকের জন্য SMS সার্ভিসের সীমা শেষ হয়ে গেছে। আগামীকাল আবার চেষ্টা করুন।"
+
+# --- Background SMS Delivery (runs on the dispatcher's sender threads) ---
+def deliver_sms(job):
+    user_id, phone_number = job['user_id'], job['phone_number']
+    try:
+        response = gateway.send(phone_number, job['message'])
+    except CircuitOpenError:
+        return False, ("SMS সার্ভিস সাময়িকভাবে বন্ধ আছে। কিছুক্ষণ পর আবার চেষ্টা করুন।", None, None)
+    except requests.exceptions.RequestException as e:
+        error_details = f"**ব্যবহারকারী:** {job['first_name']} (`{user_id}`)\n**নম্বর:** `{phone_number}`\n**এরর টাইপ:** Connection Error\n**বিস্তারিত:** `{str(e)}`"
+        return False, ("SMS পাঠানো সম্ভব হয়নি। API সার্ভারের সাথে সংযোগ করা যাচ্ছে না।", error_details, "connection")
+    if response.status_code == 200:
+        return True, None
+    error_details = f"**ব্যবহারকারী:** {job['first_name']} (`{user_id}`)\n**নম্বর:** `{phone_number}`\n**স্ট্যাটাস কোড:** `{response.status_code}`\n**API রেসপন্স:** `{response.text}`"
+    return False, ("SMS পাঠানো সম্ভব হয়নি। API থেকে সমস্যা হয়েছে। অ্যাডমিনের সাথে যোগাযোগ করুন।", error_details, response.status_code)
+
+def report_sms_result(job, delivered, details):
+    # The dispatcher has already released the job's send-limit hold.
+    if delivered:
+        result_text = f"✅ '{job['phone_number']}' নম্বরে আপনার SMS সফলভাবে পাঠানোর জন্য অনুরোধ করা হয়েছে।"
     else:
-        if user_data[1] != today:
-            cursor.execute("UPDATE users SET sms_sent = 0, last_sms_date = ? WHERE user_id = ?", (today, user_id))
-            conn.commit()
-            sms_sent = 0
-        else: sms_sent = user_data[0]
-        bonus_sms = user_data[2]
-    total_limit = 10 + bonus_sms
-    if sms_sent >= total_limit:
-        bot.reply_to(message, f"আপনি আপনার দৈনিক SMS পাঠানোর সীমা ({total_limit} টি) অতিক্রম করেছেন।")
+        result_text, error_details, status = details or ("SMS পাঠানো সম্ভব হয়নি। অ্যাডমিনের সাথে যোগাযোগ করুন।", None, None)
+        if error_details:
+            alert_admins(error_details, is_error=True, status=status)
+    bot.edit_message_text(result_text, job['chat_id'], job['reply_message_id'])
+
+def on_gateway_state_change(state):
+    if state == GatewayClient.OPEN:
+        admin_notifier.broadcast(ERROR_ALERT_PREFIX + f"SMS গেটওয়ে বারবার ব্যর্থ হচ্ছে, তাই সাময়িকভাবে পাঠানো বন্ধ রাখা হয়েছে।\n**পরিসংখ্যান:** `{gateway.stats()}`")
+    elif state == GatewayClient.CLOSED:
+        admin_notifier.broadcast(ERROR_ALERT_PREFIX + "✅ SMS গেটওয়ে আবার স্বাভাবিকভাবে কাজ করছে।")
+
+gateway_throttle = TokenBucket(GATEWAY_RATE).acquire if GATEWAY_RATE > 0 else None
+gateway = GatewayClient(SMS_API_URL, pool_size=GATEWAY_POOL_SIZE, on_state_change=on_gateway_state_change, throttle=gateway_throttle)
+dispatcher = SmsDispatcher(deliver_sms, report_sms_result, limiter.release, workers=SMS_SENDER_WORKERS)
+dispatcher.start()
+
+# --- Bulk SMS Campaigns ---
+def send_campaign_sms(campaign, phone_number):
+    while True:
+        try:
+            response = gateway.send(phone_number, campaign['message'])
+        except CircuitOpenError:
+            # Hold the slot until the gateway recovers instead of failing the rest of the list.
+            time.sleep(5)
+            continue
+        except requests.exceptions.RequestException:
+            return False
+        return response.status_code == 200
+
+def report_campaign_progress(campaign, final):
+    progress_text = f"📨 **বাল্ক SMS প্রগ্রেস**\n\n📋 মোট নম্বর: {campaign['total']}\n✅ পাঠানো: {campaign['sent']}\n❌ ব্যর্থ: {campaign['failed']}\n⏭️ বাদ পড়েছে: {campaign['skipped']}"
+    if final and campaign['status'] == 'limited':
+        progress_text += "\n\n⛔ দৈনিক SMS সীমা শেষ হওয়ায় বাকি নম্বরগুলোতে পাঠানো হয়নি।"
+    elif final:
+        progress_text += "\n\n🏁 সম্পন্ন হয়েছে।"
+    try:
+        bot.edit_message_text(progress_text, campaign['chat_id'], campaign['progress_message_id'], parse_mode="Markdown")
+    except telebot.apihelper.ApiTelegramException as e:
+        if "message is not modified" not in str(e): raise e
+
+def reserve_campaign_sms(user_id, phone_number):
+    return limiter.reserve(sms_reservation(user_id, phone_number)).hold_id
+
+campaign_runner = CampaignRunner(send_campaign_sms, reserve_campaign_sms, limiter.release, report_campaign_progress, concurrency=BULK_CONCURRENCY)
+campaign_runner.start_watcher()
+
+# --- Queue Depth Gauges (evaluated on each /metrics scrape) ---
+metrics.QUEUE_DEPTH.set_function(dispatcher.depth, queue="pending_sms")
+metrics.QUEUE_DEPTH.set_function(admin_notifier.depth, queue="admin_notifications")
+metrics.QUEUE_DEPTH.set_function(lambda: storage.fetch_value("SELECT COUNT(*) FROM campaign_numbers WHERE status IN ('queued', 'sending')"), queue="campaign_numbers")
+
+# --- Backups and Log Exports (run on the backup worker thread) ---
+def send_backup_file(chat_id, path, filename, rows):
+    caption = "ডাটাবেস ব্যাকআপ" if rows is None else f"SMS লগ এক্সপোর্ট ({rows}টি সারি)"
+    with open(path, 'rb') as backup_file:
+        bot.send_document(chat_id, backup_file, visible_file_name=filename, caption=caption)
+
+def report_backup_error(chat_id, error):
+    bot.send_message(chat_id, f"❌ ব্যাকআপ/এক্সপোর্ট তৈরি করা যায়নি: {error}")
+
+backup_worker = backup.BackupWorker(send_backup_file, report_backup_error)
+backup_worker.start()
+metrics.QUEUE_DEPTH.set_function(backup_worker.depth, queue="backup_jobs")
+
+# With SMS_LOG_RETENTION_DAYS set (off by default), old sms_log rows are archived
+# to ARCHIVE_DIR and kept only as daily counts.
+retention_worker = RetentionWorker(retention_days=SMS_LOG_RETENTION_DAYS, archive_dir=ARCHIVE_DIR)
+retention_worker.start()
+
+EXPORT_USAGE = "ফরম্যাট: `/export <csv|jsonl> [শুরুর তারিখ] [শেষ তারিখ] [ইউজার আইডি]`\nযেমন: `/export csv 2024-01-01 2024-01-31` অথবা `/export jsonl 12345678`"
+
+@bot.message_handler(commands=['export'])
+@metrics.timed_handler("export")
+def export_command(message):
+    if not is_admin(message.from_user.id): return
+    fmt, days, target_user_id = 'csv', [], None
+    for arg in message.text.split()[1:]:
+        if arg.lower() in backup.EXPORT_FORMATS:
+            fmt = arg.lower()
+        elif re.fullmatch(r'\d{4}-\d{2}-\d{2}', arg):
+            days.append(arg)
+        elif arg.isdigit():
+            target_user_id = int(arg)
+        else:
+            bot.reply_to(message, "❌ ভুল ফরম্যাট।\n" + EXPORT_USAGE, parse_mode="Markdown")
+            return
+    try:
+        for day in days: datetime.date.fromisoformat(day)
+    except ValueError:
+        bot.reply_to(message, "❌ তারিখ সঠিক নয়।\n" + EXPORT_USAGE, parse_mode="Markdown")
+        return
+    if len(days) > 2:
+        bot.reply_to(message, "❌ সর্বোচ্চ দুটি তারিখ দিন।\n" + EXPORT_USAGE, parse_mode="Markdown")
         return
-    cursor.execute("SELECT COUNT(*) FROM sms_log WHERE user_id = ? AND phone_number = ? AND DATE(timestamp) = ?", (user_id, phone_number, today))
-    same_number_count = cursor.fetchone()[0]
-    if same_number_count >= 4:
-        bot.reply_to(message, "আপনি এই নম্বরে দিনে সর্বোচ্চ ৪টি SMS পাঠাতে পারবেন।")
+    start_day = days[0] if days else None
+    end_day = days[1] if len(days) > 1 else None
+    backup_worker.request_export(message.chat.id, fmt, start_day, end_day, target_user_id)
+    bot.reply_to(message, "⏳ SMS লগ এক্সপোর্ট তৈরি হচ্ছে, তৈরি হলে ফাইলটি পাঠানো হবে।")
+
+def prompt_bulk_upload(user_id, chat_id):
+    state_store.set(user_id, 'awaiting_bulk_file')
+    bot.send_message(chat_id, "📨 **বাল্ক SMS**\n\nনম্বরের তালিকাসহ একটি CSV বা TXT ফাইল পাঠান (প্রতি লাইনে বা কমা দিয়ে আলাদা করা নম্বর)। দৈনিক SMS সীমা এবং প্রতি নম্বরে ৪টির সীমা প্রযোজ্য।", parse_mode="Markdown")
+
+@bot.message_handler(commands=['bulk'])
+@metrics.timed_handler("bulk")
+def bulk_command(message):
+    if not is_channel_member(message.from_user.id):
+        bot.reply_to(message, "অনুগ্রহ করে প্রথমে চ্যানেলে যোগ দিন।", reply_markup=force_join_keyboard())
+        return
+    prompt_bulk_upload(message.from_user.id, message.chat.id)
+
+@bot.message_handler(content_types=['document'])
+@metrics.timed_handler("bulk_file")
+def handle_bulk_file(message):
+    user_id = message.from_user.id
+    state_data = state_store.get(user_id)
+    if not state_data or state_data[0] != 'awaiting_bulk_file':
+        return
+    document = message.document
+    if not (document.file_name or '').lower().endswith(('.csv', '.txt')):
+        bot.reply_to(message, "❌ শুধুমাত্র CSV বা TXT ফাইল পাঠান।")
         return
+    campaign_id = campaign_runner.create(user_id, message.from_user.first_name, message.chat.id)
     try:
-        response = requests.get(SMS_API_URL, params={'number': phone_number, 'sms': sms_text}, timeout=30)
-        if response.status_code == 200:
-            cursor.execute("UPDATE users SET sms_sent = sms_sent + 1 WHERE user_id = ?", (user_id,))
-            cursor.execute("INSERT INTO sms_log (user_id, phone_number, message, timestamp) VALUES (?, ?, ?, ?)", (user_id, phone_number, sms_text, datetime.datetime.now().isoformat()))
-            conn.commit()
-            bot.reply_to(message, f"✅ '{phone_number}' নম্বরে আপনার SMS সফলভাবে পাঠানোর জন্য অনুরোধ করা হয়েছে।")
-        else:
-            bot.reply_to(message, f"SMS পাঠানো সম্ভব হয়নি। API থেকে সমস্যা হয়েছে। অ্যাডমিনের সাথে যোগাযোগ করুন।")
-            error_details = f"**ব্যবহারকারী:** {message.from_user.first_name} (`{user_id}`)\n**নম্বর:** `{phone_number}`\n**স্ট্যাটাস কোড:** `{response.status_code}`\n**API রেসপন্স:** `{response.text}`"
-            alert_admins(error_details, is_error=True)
-    except requests.exceptions.RequestException as e:
-        bot.reply_to(message, "SMS পাঠানো সম্ভব হয়নি। API সার্ভারের সাথে সংযোগ করা যাচ্ছে না।")
-        error_details = f"**ব্যবহারকারী:** {message.from_user.first_name} (`{user_id}`)\n**নম্বর:** `{phone_number}`\n**এরর টাইপ:** Connection Error\n**বিস্তারিত:** `{str(e)}`"
-        alert_admins(error_details, is_error=True)
+        # Stream the file line by line; it is never held in memory as a whole.
+        with requests.get(bot.get_file_url(document.file_id), stream=True, timeout=60) as response:
+            response.raise_for_status()
+            lines = (line.decode('utf-8', 'ignore') for line in response.iter_lines())
+            added, invalid, duplicates = campaign_runner.add_numbers(campaign_id, lines)
+    except (requests.exceptions.RequestException, telebot.apihelper.ApiTelegramException):
+        campaign_runner.discard(campaign_id)
+        bot.reply_to(message, "❌ ফাইলটি ডাউনলোড করা যায়নি। আবার চেষ্টা করুন।")
+        return
+    if not added:
+        campaign_runner.discard(campaign_id)
+        bot.reply_to(message, "❌ ফাইলে কোনো বৈধ নম্বর পাওয়া যায়নি।")
+        return
+    state_store.set(user_id, 'awaiting_bulk_message', str(campaign_id))
+    bot.reply_to(message, f"✅ {added}টি নম্বর পাওয়া গেছে ({invalid}টি অবৈধ ও {duplicates}টি ডুপ্লিকেট বাদ দেওয়া হয়েছে)।\nএখন সব নম্বরে পাঠানোর মেসেজটি লিখুন।")
 
 @bot.message_handler(commands=['help'])
+@metrics.timed_handler("help")
 def help_command(message):
     # (Implementation is the same as the previous complete version)
     pass
     
 # --- Stateful Message Handler ---
 @bot.message_handler(func=lambda message: not message.text.startswith('/'))
+@metrics.timed_handler("stateful_message")
 def handle_stateful_messages(message):
     user_id = message.from_user.id
-    cursor.execute("SELECT current_action, temp_data FROM users WHERE user_id = ?", (user_id,))
-    state_data = cursor.fetchone()
-    if state_data and state_data[0]:
+    state_data = state_store.get(user_id)
+    if state_data:
         action = state_data[0]
         if action == 'awaiting_number':
             phone_number = message.text.strip()
             if not phone_number.isdigit() or len(phone_number) < 10:
                 bot.reply_to(message, "❌ এটি একটি সঠিক ফোন নম্বর নয়। অনুগ্রহ করে আবার চেষ্টা করুন।")
                 return
-            cursor.execute("UPDATE users SET current_action = 'awaiting_message', temp_data = ? WHERE user_id = ?", (phone_number, user_id))
-            conn.commit()
+            state_store.set(user_id, 'awaiting_message', phone_number)
             bot.reply_to(message, f"✅ নম্বর `({phone_number})` সেভ করা হয়েছে। এখন আপনার মেসেজটি লিখুন।", parse_mode="Markdown")
         elif action == 'awaiting_message':
             sms_text = message.text
             phone_number = state_data[1]
-            cursor.execute("UPDATE users SET current_action = NULL, temp_data = NULL WHERE user_id = ?", (user_id,))
-            conn.commit()
-            # Create a fake message object to pass to the sms_command
-            fake_message = types.Message(message_id=0, from_user=message.from_user, date=message.date, chat=message.chat, content_type='text', options={}, json_string="")
-            fake_message.text = f"/sms {phone_number} {sms_text}"
-            sms_command(fake_message)
-    else:
+            state_store.set(user_id, None)
+            if not is_channel_member(user_id):
+                bot.reply_to(message, "অনুগ্রহ করে প্রথমে চ্যানেলে যোগ দিন।", reply_markup=force_join_keyboard())
+                return
+            queue_sms(message, phone_number, sms_text)
+        elif action == 'awaiting_bulk_file':
+            bot.reply_to(message, "অনুগ্রহ করে নম্বরের তালিকাসহ একটি CSV বা TXT ফাইল পাঠান।")
+        elif action == 'awaiting_bulk_message':
+            campaign_id = int(state_data[1])
+            state_store.set(user_id, None)
+            progress = bot.send_message(message.chat.id, "📨 বাল্ক SMS পাঠানো শুরু হচ্ছে...")
+            campaign_runner.start(campaign_id, message.text, progress.message_id)
+    elif is_admin(user_id):
         handle_admin_input(message)
 
 def handle_admin_input(message):
     user_id = message.from_user.id
-    cursor.execute("SELECT temp_admin_action FROM users WHERE user_id = ?", (user_id,))
-    action_data = cursor.fetchone()
-    if not action_data or not action_data[0]: return
-    action_type = action_data[0]
-    cursor.execute("UPDATE users SET temp_admin_action = NULL WHERE user_id = ?", (user_id,))
-    conn.commit()
+    state_data = state_store.pop(user_id, scope=ADMIN)
+    if not state_data: return
+    action_type = state_data[0]
     if action_type == "set_bonus":
         try:
             target_user_id, bonus_amount = map(int, message.text.split())
-            cursor.execute("UPDATE users SET bonus_sms = bonus_sms + ? WHERE user_id = ?", (bonus_amount, target_user_id))
-            conn.commit()
+            if not storage.add_bonus(target_user_id, bonus_amount):
+                bot.send_message(message.chat.id, f"❌ {target_user_id} আইডির কোনো ব্যবহারকারী পাওয়া যায়নি।")
+                return
             bot.send_message(message.chat.id, f"✅ ব্যবহারকারী {target_user_id} কে {bonus_amount}টি বোনাস SMS দেওয়া হয়েছে।")
             bot.send_message(target_user_id, f"🎉 অভিনন্দন! অ্যাডমিন আপনাকে {bonus_amount}টি বোনাস SMS দিয়েছেন।")
         except (ValueError, IndexError):
@@ -262,10 +470,8 @@ def handle_admin_input(message):
     elif action_type == "get_user_sms":
         try:
             target_user_id = int(message.text)
-            cursor.execute("SELECT COUNT(*) FROM sms_log WHERE user_id = ?", (target_user_id,))
-            total_sms_sent = cursor.fetchone()[0]
-            cursor.execute("SELECT phone_number, timestamp FROM sms_log WHERE user_id = ? ORDER BY timestamp DESC LIMIT 20", (target_user_id,))
-            logs = cursor.fetchall()
+            total_sms_sent = storage.count_user_sms(target_user_id)
+            logs = storage.get_user_sms_page(target_user_id, 20)
             if not logs:
                 bot.send_message(message.chat.id, f"ব্যবহারকারী {target_user_id} এর কোনো লগ নেই।")
                 return
@@ -278,8 +484,27 @@ def handle_admin_input(message):
         except ValueError:
             bot.send_message(message.chat.id, "❌ ভুল ইউজার আইডি। শুধুমাত্র সংখ্যা ব্যবহার করুন।")
 
+# --- Channel Membership Updates (keeps the membership cache fresh) ---
+@bot.chat_member_handler()
+@metrics.timed_handler("chat_member")
+def handle_chat_member_update(update):
+    if is_our_channel(update.chat):
+        membership_cache.set(update.new_chat_member.user.id, update.new_chat_member.status in MEMBER_STATUSES)
+
 # --- Callback Query Handler (Fully Implemented) ---
+CALLBACK_ACTIONS = {"main_menu", "show_profile", "show_help", "get_referral", "send_message_start", "admin_menu",
+                    "show_stats", "refresh_stats", "get_backup", "bulk_start", "prompt_set_bonus", "prompt_user_sms"}
+
+def callback_label(data):
+    # Paginated actions carry a page or cursor; label them by the action only.
+    # Anything else shares one label, so callback data cannot mint new series.
+    for prefix, label in (("history_page_", "history"), ("hist:", "history"), ("userlist_page_", "userlist"), ("users:", "userlist")):
+        if data.startswith(prefix):
+            return label
+    return data if data in CALLBACK_ACTIONS else "other"
+
 @bot.callback_query_handler(func=lambda call: True)
+@metrics.timed_handler(lambda call: "callback:" + callback_label(call.data or ""))
 def handle_callback_query(call):
     user_id = call.from_user.id
     action = call.data
@@ -290,28 +515,26 @@ def handle_callback_query(call):
     if action == "main_menu":
         bot.edit_message_text("মূল মেনু:", message.chat.id, message.message_id, reply_markup=main_menu_keyboard(user_id))
     elif action == "show_profile":
-        cursor.execute("SELECT sms_sent, last_sms_date, bonus_sms FROM users WHERE user_id = ?", (user_id,))
-        user_data = cursor.fetchone()
-        sms_sent_today = user_data[0] if user_data and user_data[1] == str(datetime.date.today()) else 0
-        bonus_sms = user_data[2] if user_data else 0
-        daily_limit = 10
+        sms_sent_today, bonus_sms, total_sent_ever = storage.get_profile(user_id, str(datetime.date.today()))
+        daily_limit = DAILY_SMS_LIMIT
         remaining_sms = (daily_limit - sms_sent_today) + bonus_sms
-        cursor.execute("SELECT COUNT(*) FROM sms_log WHERE user_id = ?", (user_id,))
-        total_sent_ever = cursor.fetchone()[0]
         profile_text = f"👤 **আপনার প্রোফাইল**\n\n🔹 **দৈনিক লিমিট:**\n   - ব্যবহৃত: {sms_sent_today} টি\n   - বাকি আছে: {daily_limit - sms_sent_today} টি\n\n🔸 **বোনাস:** {bonus_sms} টি SMS\n\n✅ **আজ মোট পাঠাতে পারবেন:** {remaining_sms} টি\n\n📈 **লাইফটাইম পরিসংখ্যান:**\n   - মোট পাঠানো SMS: {total_sent_ever} টি"
         keyboard = types.InlineKeyboardMarkup()
         keyboard.add(types.InlineKeyboardButton("🔄 রিফ্রেশ", callback_data="show_profile"))
         keyboard.add(types.InlineKeyboardButton("🔙 মূল মেনু", callback_data="main_menu"))
         bot.edit_message_text(profile_text, message.chat.id, message.message_id, parse_mode="Markdown", reply_markup=keyboard)
-    elif action.startswith("history_page_"):
-        page = int(action.split('_')[2])
+    elif action.startswith("history_page_") or action.startswith("hist:"):
         per_page = 10
-        offset = (page - 1) * per_page
-        cursor.execute("SELECT phone_number, timestamp FROM sms_log WHERE user_id = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?", (user_id, per_page, offset))
-        logs = cursor.fetchall()
-        cursor.execute("SELECT COUNT(*) FROM sms_log WHERE user_id = ?", (user_id,))
-        total_logs = cursor.fetchone()[0]
-        total_pages = (total_logs + per_page - 1) // per_page or 1
+        if action.startswith("hist:"):
+            direction, page, token = pagination.parse_callback(action)
+            cursor = pagination.decode_log_cursor(token)
+        else:
+            direction, page, cursor = pagination.OLDER, 1, None
+        rows = storage.get_user_sms_page(user_id, per_page + 1, cursor, newer=direction == pagination.NEWER)
+        logs, has_newer, has_older = pagination.trim_page(rows, per_page, cursor, direction)
+        if not has_newer: page = 1
+        total_logs = storage.count_user_log_rows(user_id)
+        total_pages = max((total_logs + per_page - 1) // per_page, page)
         if not logs:
             bot.answer_callback_query(call.id, "আপনার কোনো SMS পাঠানোর ইতিহাস নেই।", show_alert=True)
             return
@@ -321,8 +544,8 @@ def handle_callback_query(call):
             history_text += f"📞 নম্বর: `{log[0]}`\n🗓️ সময়: {dt_obj.strftime('%Y-%m-%d %H:%M')}\n---\n"
         row = []
         keyboard = types.InlineKeyboardMarkup()
-        if page > 1: row.append(types.InlineKeyboardButton("⬅️ আগের", callback_data=f"history_page_{page-1}"))
-        if page < total_pages: row.append(types.InlineKeyboardButton("পরের ➡️", callback_data=f"history_page_{page+1}"))
+        if has_newer: row.append(types.InlineKeyboardButton("⬅️ আগের", callback_data=pagination.make_callback("hist", pagination.NEWER, page - 1, pagination.encode_log_cursor(logs[0][1], logs[0][2]))))
+        if has_older: row.append(types.InlineKeyboardButton("পরের ➡️", callback_data=pagination.make_callback("hist", pagination.OLDER, page + 1, pagination.encode_log_cursor(logs[-1][1], logs[-1][2]))))
         keyboard.add(*row)
         keyboard.add(types.InlineKeyboardButton("🔙 মূল মেনু", callback_data="main_menu"))
         bot.edit_message_text(history_text, message.chat.id, message.message_id, reply_markup=keyboard, parse_mode="Markdown")
@@ -335,43 +558,43 @@ def handle_callback_query(call):
         referral_text = f"**🔗 আপনার রেফারেল লিঙ্ক**\n\nএই লিংকটি আপনার বন্ধুদের সাথে শেয়ার করুন। প্রতিটি সফল রেফারেলের জন্য আপনি **৩টি বোনাস SMS** পাবেন!\n\n`{referral_link}`\n\n_(লিংকটির উপর ক্লিক করলে এটি কপি হয়ে যাবে।)_"
         bot.edit_message_text(referral_text, message.chat.id, message.message_id, parse_mode="Markdown", reply_markup=back_to_main_menu_keyboard())
     elif action == "send_message_start":
-        cursor.execute("UPDATE users SET current_action = 'awaiting_number' WHERE user_id = ?", (user_id,))
-        conn.commit()
+        state_store.set(user_id, 'awaiting_number')
         bot.edit_message_text("বেশ! অনুগ্রহ করে যে নম্বরে SMS পাঠাতে চান, সেটি পাঠান।", message.chat.id, message.message_id, reply_markup=back_to_main_menu_keyboard())
     elif action == "admin_menu":
         if not is_admin(user_id): return
         bot.edit_message_text("🔑 **অ্যাডমিন প্যানেল**", message.chat.id, message.message_id, reply_markup=admin_menu_keyboard(), parse_mode="Markdown")
-    elif action.startswith("userlist_page_"):
+    elif action.startswith("userlist_page_") or action.startswith("users:"):
         if not is_admin(user_id): return
-        page = int(action.split('_')[2])
         per_page = 10
-        offset = (page - 1) * per_page
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-        total_pages = (total_users + per_page - 1) // per_page or 1
-        cursor.execute("SELECT user_id, first_name, username FROM users ORDER BY user_id DESC LIMIT ? OFFSET ?", (per_page, offset))
-        users_on_page = cursor.fetchall()
+        if action.startswith("users:"):
+            direction, page, token = pagination.parse_callback(action)
+            cursor = pagination.decode_user_cursor(token)
+        else:
+            direction, page, cursor = pagination.OLDER, 1, None
+        rows = storage.get_users_page(per_page + 1, cursor, newer=direction == pagination.NEWER)
+        users_on_page, has_newer, has_older = pagination.trim_page(rows, per_page, cursor, direction)
+        if not has_newer: page = 1
+        total_users = storage.count_users()
+        total_pages = max((total_users + per_page - 1) // per_page, page)
         userlist_text = f"👥 **সকল ব্যবহারকারীর তালিকা** (পেজ: {page}/{total_pages})\n\n"
         if not users_on_page:
             userlist_text += "কোনো ব্যবহারকারী পাওয়া যায়নি।"
         else:
             for user in users_on_page:
-                uid, fname, uname = user
-                cursor.execute("SELECT COUNT(*) FROM sms_log WHERE user_id = ?", (uid,))
-                sms_count = cursor.fetchone()[0]
+                uid, fname, uname, sms_count = user
                 userlist_text += f"👤 **{fname}** (@{uname})\n   - আইডি: `{uid}`\n   - মোট SMS: **{sms_count}**\n---\n"
         row = []
         keyboard = types.InlineKeyboardMarkup()
-        if page > 1: row.append(types.InlineKeyboardButton("⬅️ আগের", callback_data=f"userlist_page_{page-1}"))
-        if page < total_pages: row.append(types.InlineKeyboardButton("পরের ➡️", callback_data=f"userlist_page_{page+1}"))
+        if has_newer and users_on_page: row.append(types.InlineKeyboardButton("⬅️ আগের", callback_data=pagination.make_callback("users", pagination.NEWER, page - 1, pagination.encode_user_cursor(users_on_page[0][0]))))
+        if has_older: row.append(types.InlineKeyboardButton("পরের ➡️", callback_data=pagination.make_callback("users", pagination.OLDER, page + 1, pagination.encode_user_cursor(users_on_page[-1][0]))))
         keyboard.add(*row)
         keyboard.add(types.InlineKeyboardButton("🔙 অ্যাডমিন মেনু", callback_data="admin_menu"))
         bot.edit_message_text(userlist_text, call.message.chat.id, message.message_id, reply_markup=keyboard, parse_mode="Markdown")
     elif action == "show_stats" or action == "refresh_stats":
         if not is_admin(user_id): return
-        cursor.execute("SELECT COUNT(*) FROM users"); total_users = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM sms_log"); total_sms = cursor.fetchone()[0]
-        today = str(datetime.date.today()); cursor.execute("SELECT COUNT(*) FROM sms_log WHERE DATE(timestamp) = ?", (today,)); today_sms = cursor.fetchone()[0]
+        total_users = storage.count_users()
+        total_sms = storage.count_all_sms()
+        today_sms = storage.count_sms_on(str(datetime.date.today()))
         stats_text = f"📊 **বট পরিসংখ্যান**\n\n👨‍👩‍👧‍👦 মোট ব্যবহারকারী: {total_users}\n📤 মোট পাঠানো SMS: {total_sms}\n📈 আজ পাঠানো SMS: {today_sms}"
         keyboard = types.InlineKeyboardMarkup(); keyboard.add(types.InlineKeyboardButton("🔄 রিফ্রেশ", callback_data="refresh_stats")); keyboard.add(types.InlineKeyboardButton("🔙 অ্যাডমিন মেনু", callback_data="admin_menu"))
         try: bot.edit_message_text(stats_text, call.message.chat.id, message.message_id, reply_markup=keyboard, parse_mode="Markdown")
@@ -380,30 +603,72 @@ def handle_callback_query(call):
             else: bot.answer_callback_query(call.id, "Stats up-to-date.")
     elif action == "get_backup":
         if not is_admin(user_id): return
-        try:
-            with open('sms_bot.db', 'rb') as db_file: bot.send_document(call.message.chat.id, db_file, caption="ডাটাবেস ব্যাকআপ")
-            bot.answer_callback_query(call.id, "ব্যাকআপ ফাইল পাঠানো হয়েছে।")
-        except Exception as e: bot.answer_callback_query(call.id, f"ত্রুটি: {e}", show_alert=True)
+        backup_worker.request_backup(call.message.chat.id)
+        bot.answer_callback_query(call.id, "ব্যাকআপ তৈরি হচ্ছে, তৈরি হলে ফাইলটি পাঠানো হবে।")
+    elif action == "bulk_start":
+        if not is_admin(user_id): return
+        prompt_bulk_upload(user_id, call.message.chat.id)
     elif action == "prompt_set_bonus":
         if not is_admin(user_id): return
-        cursor.execute("UPDATE users SET temp_admin_action = 'set_bonus' WHERE user_id = ?", (user_id,)); conn.commit()
+        state_store.set(user_id, 'set_bonus', scope=ADMIN)
         bot.send_message(call.message.chat.id, "যে ইউজারকে বোনাস দিতে চান, তার আইডি এবং বোনাস পরিমাণ দিন।\nফরম্যাট: `USER_ID AMOUNT`\nযেমন: `12345678 50`", parse_mode="Markdown")
     elif action == "prompt_user_sms":
         if not is_admin(user_id): return
-        cursor.execute("UPDATE users SET temp_admin_action = 'get_user_sms' WHERE user_id = ?", (user_id,)); conn.commit()
+        state_store.set(user_id, 'get_user_sms', scope=ADMIN)
         bot.send_message(call.message.chat.id, "যে ইউজারের লগ দেখতে চান, তার আইডি দিন।\nযেমন: `12345678`")
 
 # --- Flask Webhook Setup ---
+# --- Webhook Update Pool ---
+UPDATE_KINDS = ('message', 'edited_message', 'callback_query', 'chat_member', 'my_chat_member')
+
+def update_key(payload):
+    # Updates from the same user share a worker so they are handled in order.
+    for kind in UPDATE_KINDS:
+        body = payload.get(kind)
+        if isinstance(body, dict):
+            member = body.get('new_chat_member')
+            user = body.get('from') or (member.get('user') if isinstance(member, dict) else None)
+            return user.get('id', payload.get('update_id')) if isinstance(user, dict) else payload.get('update_id')
+    return payload.get('update_id')
+
+def process_update(payload):
+    bot.process_new_updates([telebot.types.Update.de_json(payload)])
+
+update_pool = OrderedUpdatePool(process_update, workers=UPDATE_WORKERS)
+update_pool.start()
+metrics.QUEUE_DEPTH.set_function(update_pool.depth, queue="telegram_updates")
+
 @app.route('/' + BOT_TOKEN, methods=['POST'])
 def get_message():
-    json_string = request.get_data().decode('utf-8'); update = telebot.types.Update.de_json(json_string)
-    bot.process_new_updates([update]); return "!", 200
+    if WEBHOOK_SECRET and not hmac.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), WEBHOOK_SECRET):
+        return "Forbidden", 403
+    try:
+        payload = json.loads(request.get_data())
+    except ValueError:
+        return "Bad Request", 400
+    if not isinstance(payload, dict) or not isinstance(payload.get('update_id'), int):
+        return "Bad Request", 400
+    # Acknowledge straight away; handlers run on the update pool.
+    result = update_pool.submit(payload.get('update_id'), update_key(payload), payload)
+    if result == FULL:
+        return "Busy", 503
+    return "!", 200
+
+def metrics_allowed():
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}")
+    return request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+
+@app.route("/metrics")
+def metrics_endpoint():
+    if not metrics_allowed():
+        return "Forbidden", 403
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 @app.route("/")
 def webhook():
-    bot.remove_webhook(); bot.set_webhook(url=f"{WEBHOOK_URL}/{BOT_TOKEN}")
+    bot.remove_webhook(); bot.set_webhook(url=f"{WEBHOOK_URL}/{BOT_TOKEN}", allowed_updates=["message", "callback_query", "chat_member"], secret_token=WEBHOOK_SECRET)
     return "Webhook has been set successfully!", 200
 
 if __name__ == "__main__":
-    setup_database()
     app.run(host="0.0.0.0", port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+
+import backup
+import migrations
+import storage
+from retention import RetentionWorker
+
+# --- Maintenance Commands ---
+# Usage: python manage.py rebuild-counters | check-counters
+#        python manage.py backup OUTPUT.db.gz
+#        python manage.py export-sms [--format csv|jsonl] [--from DAY] [--to DAY] [--user ID] [OUTPUT]
+#        python manage.py apply-retention --days N [--archive-dir DIR]
+#        python manage.py enable-incremental-vacuum
+
+
+def rebuild_counters(args):
+    storage.rebuild_counters()
+    print("Counters rebuilt from sms_log.")
+
+
+def check_counters(args):
+    problems = storage.check_counters()
+    if not problems:
+        print("Counters match sms_log.")
+        return 0
+    for table, rows in problems.items():
+        print(f"{table}: {len(rows)} mismatched row(s)")
+        for row in rows[:20]:
+            print(f"  {row}")
+    return 1
+
+
+def backup_database(args):
+    backup.write_backup(args.output)
+    print(f"Backup written to {args.output}.")
+
+
+def export_sms(args):
+    if args.output == '-':
+        rows = backup.export_sms_log(sys.stdout, args.format, args.start_day, args.end_day, args.user)
+    else:
+        rows = backup.write_export(args.output, args.format, args.start_day, args.end_day, args.user)
+    print(f"Exported {rows} row(s).", file=sys.stderr)
+
+
+def apply_retention(args):
+    if args.days <= 0:
+        print("Retention is off; pass --days N or set SMS_LOG_RETENTION_DAYS.", file=sys.stderr)
+        return 1
+    worker = RetentionWorker(retention_days=args.days, archive_dir=args.archive_dir)
+    archived = worker.run_once()
+    print(f"Archived {archived} sms_log row(s) older than {worker.cutoff_day()} to {args.archive_dir}.")
+    # Stops as soon as a step frees nothing, e.g. on a file without incremental auto_vacuum.
+    while worker.vacuum_step():
+        pass
+    left = storage.fetch_value("PRAGMA freelist_count")
+    if left:
+        print(f"{left} free page(s) are still in the file; run `python manage.py enable-incremental-vacuum` with the bot stopped to return them.")
+    else:
+        print("Free pages returned to the file system.")
+
+
+def enable_incremental_vacuum(args):
+    # One full VACUUM; stop the bot first on a large database.
+    if migrations.enable_incremental_vacuum(storage.get_connection()):
+        print("Database rewritten with incremental auto_vacuum.")
+    else:
+        print("Incremental auto_vacuum is already enabled.")
+
+
+COMMANDS = {
+    'rebuild-counters': rebuild_counters,
+    'check-counters': check_counters,
+    'backup': backup_database,
+    'export-sms': export_sms,
+    'apply-retention': apply_retention,
+    'enable-incremental-vacuum': enable_incremental_vacuum,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sms-bot maintenance commands")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild-counters')
+    subparsers.add_parser('check-counters')
+    backup_parser = subparsers.add_parser('backup', help="write a gzip-compressed online backup")
+    backup_parser.add_argument('output')
+    export_parser = subparsers.add_parser('export-sms', help="stream sms_log as CSV or JSON lines")
+    export_parser.add_argument('output', nargs='?', default='-', help="gzip file to write, or - for stdout")
+    export_parser.add_argument('--format', choices=backup.EXPORT_FORMATS, default='csv')
+    export_parser.add_argument('--from', dest='start_day', help="first day, YYYY-MM-DD")
+    export_parser.add_argument('--to', dest='end_day', help="last day, YYYY-MM-DD")
+    export_parser.add_argument('--user', type=int)
+    retention_parser = subparsers.add_parser('apply-retention', help="archive old sms_log rows and reclaim space")
+    retention_parser.add_argument('--days', type=int, default=int(os.environ.get("SMS_LOG_RETENTION_DAYS", "0")), help="archive rows older than N days (required unless SMS_LOG_RETENTION_DAYS is set)")
+    retention_parser.add_argument('--archive-dir', default=os.environ.get("ARCHIVE_DIR", "archive"))
+    subparsers.add_parser('enable-incremental-vacuum', help="switch an existing database to incremental auto_vacuum (one full VACUUM)")
+    args = parser.parse_args(argv)
+    storage.setup_database()
+    return COMMANDS[args.command](args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
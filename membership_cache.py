@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+
+# --- Channel Membership Cache ---
+# Bounded LRU with separate TTLs for members and non-members. Concurrent misses
+# for the same user share a single lookup instead of each calling Telegram.
+
+
+class MembershipCache:
+    def __init__(self, lookup, max_size=10000, positive_ttl=300, negative_ttl=30):
+        # lookup(user_id) -> bool; an exception means "unknown" and is not cached.
+        self.lookup = lookup
+        self.max_size = max_size
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, user_id, is_member):
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self._entries[user_id] = (is_member, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            waiter = self._in_flight.get(user_id)
+            if waiter is None:
+                waiter = self._in_flight[user_id] = [threading.Event(), False]
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            waiter[0].wait()
+            return waiter[1]
+        try:
+            is_member = bool(self.lookup(user_id))
+            waiter[1] = is_member
+            with self._lock:
+                self._store(user_id, is_member)
+        except Exception as e:
+            print(f"Membership lookup failed for {user_id}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.pop(user_id, None)
+            waiter[0].set()
+        return waiter[1]
+
+    def set(self, user_id, is_member):
+        with self._lock:
+            self._store(user_id, is_member)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
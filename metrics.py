@@ -0,0 +1,193 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# --- In-Process Metrics ---
+# Minimal Prometheus text-format metrics with no external dependency. Each
+# observation is a perf_counter() call, a bisect and a short locked update,
+# cheap enough to leave on in production. The Flask app serves render() on
+# /metrics.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = list(self._series.items())
+        return self._header() + [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in series]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        # Evaluated at scrape time, e.g. for queue depths.
+        with self._lock:
+            self._series[self._key(labels)] = function
+
+    def render(self):
+        with self._lock:
+            series = list(self._series.items())
+        lines = self._header()
+        for key, value in series:
+            if callable(value):
+                try:
+                    value = value()
+                except Exception as e:
+                    print(f"Metric {self.name} callback failed: {e}")
+                    continue
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = self._header()
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {repr(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Bot Metrics ---
+HANDLER_SECONDS = Histogram("smsbot_handler_seconds", "Time spent in a bot handler.", ["handler"])
+HANDLER_ERRORS = Counter("smsbot_handler_errors_total", "Handler invocations that raised.", ["handler"])
+DB_QUERY_SECONDS = Histogram("smsbot_db_query_seconds", "Time spent in a named SQLite query.", ["query"])
+TELEGRAM_API_SECONDS = Histogram("smsbot_telegram_api_seconds", "Telegram Bot API call time.", ["method"])
+TELEGRAM_API_ERRORS = Counter("smsbot_telegram_api_errors_total", "Telegram Bot API calls that failed at the HTTP level.", ["method"])
+GATEWAY_SECONDS = Histogram("smsbot_gateway_seconds", "SMS gateway call time.")
+GATEWAY_RESPONSES = Counter("smsbot_gateway_responses_total", "SMS gateway responses by status code.", ["status"])
+QUEUE_DEPTH = Gauge("smsbot_queue_depth", "Items waiting in an in-process or persistent queue.", ["queue"])
+
+
+def timed_handler(label):
+    # `label` is a handler name, or a function of the handler's first argument
+    # (e.g. to label each callback action separately).
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            name = label(*args) if callable(label) else label
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=name)
+                raise
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+        return wrapper
+    return decorator
+
+
+def timed_query(function):
+    name = function.__qualname__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, query=name)
+    return wrapper
+
+
+def timed_request_sender(send):
+    # Wraps a telebot CUSTOM_REQUEST_SENDER-style callable.
+    def sender(method, url, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            return send(method, url, **kwargs)
+        except Exception:
+            TELEGRAM_API_ERRORS.inc(method=api_method)
+            raise
+        finally:
+            TELEGRAM_API_SECONDS.observe(time.perf_counter() - started, method=api_method)
+    return sender
@@ -0,0 +1,157 @@
+# --- Schema Migrations ---
+# Each migration runs once, in order, inside its own transaction. The applied
+# version is kept in SQLite's `PRAGMA user_version`. Never edit a migration
+# that has shipped; append a new one instead. Migrations spell out their own
+# SQL rather than calling into other modules, so later changes there cannot
+# alter what an old migration does.
+
+
+def _initial_schema(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        first_name TEXT,
+        username TEXT,
+        sms_sent INTEGER DEFAULT 0,
+        last_sms_date TEXT,
+        bonus_sms INTEGER DEFAULT 0,
+        temp_admin_action TEXT,
+        current_action TEXT,
+        temp_data TEXT
+    )''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sms_log (
+        log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        phone_number TEXT,
+        message TEXT,
+        timestamp TEXT
+    )''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS pending_sms (
+        sms_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        first_name TEXT,
+        chat_id INTEGER,
+        reply_message_id INTEGER,
+        phone_number TEXT,
+        message TEXT,
+        status TEXT DEFAULT 'queued',
+        attempts INTEGER DEFAULT 0,
+        created_at TEXT,
+        claimed_at REAL
+    )''')
+
+
+def _sms_log_indexes(conn):
+    # `day` (YYYY-MM-DD) is stored so the per-number daily cap is an index seek
+    # instead of evaluating DATE(timestamp) on every row.
+    conn.execute("ALTER TABLE sms_log ADD COLUMN day TEXT")
+    conn.execute("UPDATE sms_log SET day = substr(timestamp, 1, 10)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sms_log_user_timestamp ON sms_log (user_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sms_log_user_number_day ON sms_log (user_id, phone_number, day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sms_log_timestamp ON sms_log (timestamp)")
+
+
+def _materialized_counters(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS user_sms_totals (user_id INTEGER PRIMARY KEY, total INTEGER NOT NULL DEFAULT 0)")
+    conn.execute("CREATE TABLE IF NOT EXISTS user_daily_sms (user_id INTEGER, day TEXT, count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, day)) WITHOUT ROWID")
+    conn.execute("CREATE TABLE IF NOT EXISTS number_daily_sms (user_id INTEGER, phone_number TEXT, day TEXT, count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, phone_number, day)) WITHOUT ROWID")
+    conn.execute("CREATE TABLE IF NOT EXISTS daily_sms (day TEXT PRIMARY KEY, count INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+    conn.execute("CREATE TABLE IF NOT EXISTS global_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+    conn.execute("INSERT INTO user_sms_totals (user_id, total) SELECT user_id, COUNT(*) FROM sms_log GROUP BY user_id")
+    conn.execute("INSERT INTO user_daily_sms (user_id, day, count) SELECT user_id, day, COUNT(*) FROM sms_log GROUP BY user_id, day")
+    conn.execute("INSERT INTO number_daily_sms (user_id, phone_number, day, count) SELECT user_id, phone_number, day, COUNT(*) FROM sms_log GROUP BY user_id, phone_number, day")
+    conn.execute("INSERT INTO daily_sms (day, count) SELECT day, COUNT(*) FROM sms_log GROUP BY day")
+    conn.execute("INSERT INTO global_counters (name, value) SELECT 'sms_total', COUNT(*) FROM sms_log")
+    conn.execute("INSERT INTO global_counters (name, value) SELECT 'users_total', COUNT(*) FROM users")
+
+
+def _bulk_campaigns(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS campaigns (
+        campaign_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        first_name TEXT,
+        chat_id INTEGER,
+        progress_message_id INTEGER,
+        message TEXT,
+        status TEXT DEFAULT 'collecting',
+        total INTEGER DEFAULT 0,
+        sent INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        skipped INTEGER DEFAULT 0,
+        created_at TEXT,
+        claimed_at REAL
+    )''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS campaign_numbers (
+        campaign_id INTEGER,
+        phone_number TEXT,
+        status TEXT DEFAULT 'queued',
+        PRIMARY KEY (campaign_id, phone_number)
+    ) WITHOUT ROWID''')
+
+
+def _sms_log_rollup(conn):
+    # Per-user daily counts for sms_log rows moved out by the retention job.
+    conn.execute("CREATE TABLE IF NOT EXISTS sms_log_rollup (user_id INTEGER, day TEXT, count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, day)) WITHOUT ROWID")
+
+
+def _send_holds(conn):
+    # Send-limit slots held by queued SMS and in-flight campaign numbers, one
+    # row per policy window; see limiter.py.
+    conn.execute("CREATE TABLE IF NOT EXISTS send_holds (hold_id TEXT, policy TEXT, key TEXT, day TEXT, PRIMARY KEY (hold_id, policy)) WITHOUT ROWID")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_send_holds_window ON send_holds (policy, key, day)")
+    conn.execute("ALTER TABLE pending_sms ADD COLUMN hold_id TEXT")
+    conn.execute("ALTER TABLE campaign_numbers ADD COLUMN hold_id TEXT")
+
+
+def _rate_limits(conn):
+    # Shared pacing state for limiter.TokenBucket, one row per bucket.
+    conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (name TEXT PRIMARY KEY, next_at REAL NOT NULL) WITHOUT ROWID")
+
+
+MIGRATIONS = [
+    _initial_schema,
+    _sms_log_indexes,
+    _materialized_counters,
+    _bulk_campaigns,
+    _sms_log_rollup,
+    _send_holds,
+    _rate_limits,
+]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    # Expects a connection in autocommit mode (isolation_level=None).
+    while current_version(conn) < len(MIGRATIONS):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read under the write lock: another process may have migrated.
+            version = current_version(conn)
+            if version < len(MIGRATIONS):
+                MIGRATIONS[version](conn)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def enable_incremental_vacuum(conn):
+    # auto_vacuum cannot be changed inside a migration transaction, and an
+    # existing file only picks it up after one full VACUUM, which rewrites the
+    # whole file and blocks writers meanwhile. Run it once from manage.py;
+    # afterwards free pages are returned in small incremental_vacuum steps.
+    # Returns False if the file was already set up.
+    INCREMENTAL = 2
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+from collections import Counter, deque
+
+from telebot.apihelper import ApiTelegramException
+
+# --- Admin Notification Bus ---
+# Handlers drop events on an in-process queue and return immediately; one
+# background thread turns them into admin messages:
+#   * the first error in a window goes out at once, the rest of the window is
+#     folded into a single digest ("37 more failures, top status codes ...");
+#   * new-user notices are batched into one message per window;
+#   * each admin chat is paced to Telegram's per-chat limit, honouring any
+#     retry_after the API sends back.
+
+MAX_MESSAGE_LENGTH = 4096
+MAX_OUTBOX = 100
+
+
+class AdminNotifier:
+    def __init__(self, send, admin_ids, error_prefix, new_user_prefix, error_window=60, new_user_window=30,
+                 per_chat_interval=1.0, global_interval=0.04):
+        # send(chat_id, text) performs the actual Telegram call.
+        self.send = send
+        self.admin_ids = list(admin_ids)
+        self.error_prefix = error_prefix
+        self.new_user_prefix = new_user_prefix
+        self.error_window = error_window
+        self.new_user_window = new_user_window
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = global_interval
+        self._events = queue.Queue()
+        self._outbox = {admin_id: deque(maxlen=MAX_OUTBOX) for admin_id in self.admin_ids}
+        self._next_send_at = {admin_id: 0.0 for admin_id in self.admin_ids}
+        self._next_global_send_at = 0.0
+        self._error_window_start = None
+        self._error_count = 0
+        self._error_statuses = Counter()
+        self._last_error = None
+        self._new_users = []
+        self._new_users_since = None
+        self._thread = None
+
+    # --- Producer side (never blocks) ---
+    def notify_error(self, details, status=None):
+        self._events.put(('error', details, status))
+
+    def notify_new_user(self, details):
+        self._events.put(('new_user', details, None))
+
+    def broadcast(self, text):
+        self._events.put(('text', text, None))
+
+    def depth(self):
+        return self._events.qsize() + sum(len(outbox) for outbox in self._outbox.values())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="admin-notifier", daemon=True)
+        self._thread.start()
+
+    # --- Background sender ---
+    def _enqueue_for_admins(self, text):
+        if len(text) > MAX_MESSAGE_LENGTH:
+            text = text[:MAX_MESSAGE_LENGTH - 1] + "…"
+        for outbox in self._outbox.values():
+            outbox.append(text)
+
+    def _handle(self, event, now):
+        kind, details, status = event
+        if kind == 'text':
+            self._enqueue_for_admins(details)
+        elif kind == 'new_user':
+            if not self._new_users:
+                self._new_users_since = now
+            self._new_users.append(details)
+        elif self._error_window_start is None:
+            self._error_window_start = now
+            self._enqueue_for_admins(self.error_prefix + details)
+        else:
+            self._error_count += 1
+            self._error_statuses[status] += 1
+            self._last_error = details
+
+    def _flush_due(self, now):
+        if self._error_window_start is not None and now - self._error_window_start >= self.error_window:
+            if self._error_count:
+                top = ", ".join(f"`{status if status is not None else 'N/A'}` × {count}" for status, count in self._error_statuses.most_common(5))
+                digest = f"গত {int(now - self._error_window_start)} সেকেন্ডে আরও **{self._error_count}টি** ব্যর্থতা।\n**স্ট্যাটাস কোড:** {top}\n\n**সর্বশেষ:**\n{self._last_error}"
+                self._enqueue_for_admins(self.error_prefix + digest)
+                # Keep coalescing while failures continue.
+                self._error_window_start = now
+            else:
+                self._error_window_start = None
+            self._error_count = 0
+            self._error_statuses.clear()
+            self._last_error = None
+        if self._new_users and now - self._new_users_since >= self.new_user_window:
+            if len(self._new_users) == 1:
+                body = self._new_users[0]
+            else:
+                body = f"**{len(self._new_users)} জন নতুন ব্যবহারকারী:**\n\n" + "\n---\n".join(self._new_users)
+            self._enqueue_for_admins(self.new_user_prefix + body)
+            self._new_users = []
+            self._new_users_since = None
+
+    def _deliver(self, now):
+        for admin_id, outbox in self._outbox.items():
+            if not outbox or now < self._next_send_at[admin_id] or now < self._next_global_send_at:
+                continue
+            text = outbox.popleft()
+            try:
+                self.send(admin_id, text)
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 5)
+                    outbox.appendleft(text)
+                    self._next_send_at[admin_id] = now + retry_after
+                    continue
+                print(f"Failed to send notification to admin {admin_id}: {e}")
+            except Exception as e:
+                print(f"Failed to send notification to admin {admin_id}: {e}")
+            self._next_send_at[admin_id] = now + self.per_chat_interval
+            self._next_global_send_at = now + self.global_interval
+
+    def _next_wakeup(self, now):
+        deadlines = []
+        if self._error_window_start is not None:
+            deadlines.append(self._error_window_start + self.error_window)
+        if self._new_users:
+            deadlines.append(self._new_users_since + self.new_user_window)
+        for admin_id, outbox in self._outbox.items():
+            if outbox:
+                deadlines.append(max(self._next_send_at[admin_id], self._next_global_send_at))
+        return max(0.0, min(deadlines) - now) if deadlines else None
+
+    def _run(self):
+        while True:
+            try:
+                event = self._events.get(timeout=self._next_wakeup(time.monotonic()))
+                self._handle(event, time.monotonic())
+                while True:
+                    self._handle(self._events.get_nowait(), time.monotonic())
+            except queue.Empty:
+                pass
+            except Exception as e:
+                print(f"Admin notifier error: {e}")
+            now = time.monotonic()
+            self._flush_due(now)
+            self._deliver(now)
@@ -0,0 +1,61 @@
+import base64
+import datetime
+import struct
+
+# --- Keyset Pagination Cursors ---
+# Inline buttons carry an opaque cursor for the row at the edge of the current
+# page instead of an OFFSET, so every page is an index seek and pages do not
+# shift when new rows arrive. Telegram limits callback_data to 64 bytes:
+# "hist:n:123456:" plus a 22-character cursor stays well inside it.
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+OLDER, NEWER = 'n', 'p'
+
+
+def _pack(fmt, *values):
+    return base64.urlsafe_b64encode(struct.pack(fmt, *values)).rstrip(b'=').decode('ascii')
+
+
+def _unpack(fmt, token):
+    raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    return struct.unpack(fmt, raw)
+
+
+def encode_log_cursor(timestamp, log_id):
+    micros = (datetime.datetime.fromisoformat(timestamp) - _EPOCH) // _MICROSECOND
+    return _pack('>qq', micros, log_id)
+
+
+def decode_log_cursor(token):
+    micros, log_id = _unpack('>qq', token)
+    return (_EPOCH + micros * _MICROSECOND).isoformat(), log_id
+
+
+def encode_user_cursor(user_id):
+    return _pack('>q', user_id)
+
+
+def decode_user_cursor(token):
+    return _unpack('>q', token)[0]
+
+
+def make_callback(prefix, direction, page, cursor):
+    return f"{prefix}:{direction}:{page}:{cursor}"
+
+
+def parse_callback(data):
+    # "<prefix>:<direction>:<page>:<cursor>" -> (direction, page, cursor)
+    _, direction, page, cursor = data.split(':', 3)
+    return direction, int(page), cursor
+
+
+def trim_page(rows, per_page, cursor, direction):
+    # `rows` were fetched with limit per_page + 1, newest first; the extra row
+    # (if any) sits at the far end in the direction of travel and only tells us
+    # whether another page exists. Returns (rows, has_newer, has_older).
+    has_more = len(rows) > per_page
+    if direction == NEWER:
+        return (rows[1:] if has_more else rows), has_more, True
+    return rows[:per_page], cursor is not None, has_more
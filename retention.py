@@ -0,0 +1,114 @@
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+
+import metrics
+import storage
+
+# --- sms_log Retention ---
+# Raw sms_log rows older than `retention_days` are appended to one gzip
+# JSON-lines file per day under `archive_dir`. In the same transaction they
+# are folded into `sms_log_rollup` (per-user daily counts) and deleted. The
+# materialized counters are not touched, so profile and stats totals stay the
+# same, and counters.rebuild()/check() count the rollup alongside the raw log.
+# Work is done in batches, and the file is returned to the OS by
+# incremental_vacuum a few pages at a time. The bot never waits on one long
+# lock.
+#
+# Each batch is appended as its own gzip member and fsynced before the
+# transaction commits. A crash in between can leave a batch in the archive
+# twice; log_id tells the copies apart.
+
+ARCHIVE_COLUMNS = ('log_id', 'user_id', 'phone_number', 'message', 'timestamp')
+
+
+class RetentionWorker:
+    def __init__(self, retention_days=90, archive_dir='archive', batch_size=1000, run_interval=3600,
+                 vacuum_pages=256, vacuum_interval=60):
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.run_interval = run_interval
+        self.vacuum_pages = vacuum_pages
+        self.vacuum_interval = vacuum_interval
+
+    def cutoff_day(self, today=None):
+        today = today or datetime.date.today()
+        return str(today - datetime.timedelta(days=self.retention_days))
+
+    def _append_archive(self, day, rows):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"sms_log-{day}.jsonl.gz")
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                for row in rows:
+                    archive.write((json.dumps(dict(zip(ARCHIVE_COLUMNS, row)), ensure_ascii=False) + "\n").encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    @metrics.timed_query
+    def archive_batch(self, cutoff_day):
+        # Archives up to batch_size rows from days before cutoff_day; returns
+        # how many rows were moved.
+        with storage.transaction() as conn:
+            rows = conn.execute("SELECT log_id, user_id, phone_number, message, timestamp, day FROM sms_log WHERE timestamp < ? ORDER BY timestamp, log_id LIMIT ?", (cutoff_day, self.batch_size)).fetchall()
+            if not rows:
+                return 0
+            by_day, counts = {}, {}
+            for row in rows:
+                by_day.setdefault(row[5], []).append(row[:5])
+                counts[(row[1], row[5])] = counts.get((row[1], row[5]), 0) + 1
+            for day, day_rows in by_day.items():
+                self._append_archive(day, day_rows)
+            conn.executemany("INSERT INTO sms_log_rollup (user_id, day, count) VALUES (?, ?, ?) ON CONFLICT (user_id, day) DO UPDATE SET count = count + excluded.count", [(user_id, day, count) for (user_id, day), count in counts.items()])
+            conn.executemany("DELETE FROM sms_log WHERE log_id = ?", [(row[0],) for row in rows])
+            # Per-number counts only back today's cap; drop them with the raw rows.
+            conn.execute("DELETE FROM number_daily_sms WHERE day < ?", (cutoff_day,))
+            return len(rows)
+
+    def run_once(self, today=None):
+        if self.retention_days <= 0:
+            return 0
+        cutoff_day = self.cutoff_day(today)
+        archived = 0
+        while True:
+            moved = self.archive_batch(cutoff_day)
+            archived += moved
+            if moved < self.batch_size:
+                return archived
+            # Let handlers and senders get at the write lock between batches.
+            time.sleep(0.05)
+
+    @metrics.timed_query
+    def vacuum_step(self):
+        # Returns how many pages this step gave back. A file that predates
+        # incremental auto_vacuum cannot give any back (incremental_vacuum is
+        # a no-op there), so it always returns 0 until enable-incremental-vacuum.
+        INCREMENTAL = 2
+        conn = storage.get_connection()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != INCREMENTAL:
+            return 0
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not before:
+            return 0
+        conn.execute(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})").fetchall()
+        return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    def start(self):
+        def run():
+            next_run = time.monotonic()
+            while True:
+                try:
+                    if time.monotonic() >= next_run:
+                        archived = self.run_once()
+                        if archived:
+                            print(f"Retention: archived {archived} sms_log row(s).")
+                        next_run = time.monotonic() + self.run_interval
+                    self.vacuum_step()
+                except Exception as e:
+                    print(f"Retention job failed: {e}")
+                time.sleep(self.vacuum_interval)
+        threading.Thread(target=run, name="retention", daemon=True).start()
@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+import metrics
+
+# --- SMS Gateway Client ---
+# One shared keep-alive session for every send, retries only where the gateway
+# cannot have accepted the message, and a circuit breaker so a dead gateway is
+# not hammered (and admins are alerted once, not once per message).
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# Statuses that mean "not accepted, try again later" rather than "maybe sent".
+RETRYABLE_STATUS_CODES = (429, 503)
+
+
+def _is_connect_failure(error):
+    # Only failures that happen before the request reaches the gateway are safe
+    # to retry; a read timeout or a reset mid-response may already have sent it.
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+class GatewayClient:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, url, pool_size=10, timeout=(5, 30), max_retries=2, backoff_base=0.5, backoff_cap=8.0,
+                 failure_threshold=5, reset_timeout=60, on_state_change=None, throttle=None):
+        # throttle(), if given, blocks until another request may be sent.
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self.throttle = throttle
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._outcomes = {}
+        self._status_codes = {}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._calls = 0
+
+    # --- Circuit Breaker ---
+    def _allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def _record(self, healthy):
+        changed = None
+        with self._lock:
+            if healthy:
+                self._failures = 0
+                if self._state != self.CLOSED:
+                    self._state, changed = self.CLOSED, self.CLOSED
+            else:
+                self._failures += 1
+                if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                    self._state, changed = self.OPEN, self.OPEN
+                    self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+        if changed and self.on_state_change:
+            try:
+                self.on_state_change(changed)
+            except Exception as e:
+                print(f"Gateway state callback failed: {e}")
+
+    @property
+    def state(self):
+        return self._state
+
+    # --- Counters ---
+    def _count(self, outcome, elapsed=None, status_code=None):
+        metrics.GATEWAY_RESPONSES.inc(status=status_code if status_code is not None else outcome)
+        if elapsed is not None:
+            metrics.GATEWAY_SECONDS.observe(elapsed)
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+            if status_code is not None:
+                self._status_codes[status_code] = self._status_codes.get(status_code, 0) + 1
+            if elapsed is not None:
+                self._calls += 1
+                self._latency_total += elapsed
+                self._latency_max = max(self._latency_max, elapsed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'outcomes': dict(self._outcomes),
+                'status_codes': dict(self._status_codes),
+                'calls': self._calls,
+                'latency_avg': self._latency_total / self._calls if self._calls else 0.0,
+                'latency_max': self._latency_max,
+            }
+
+    # --- Sending ---
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def send(self, phone_number, sms_text):
+        if not self._allow():
+            self._count('circuit_open')
+            raise CircuitOpenError("SMS gateway circuit is open")
+        attempt = 0
+        while True:
+            if self.throttle:
+                self.throttle()
+            started = time.monotonic()
+            try:
+                response = self.session.get(self.url, params={'number': phone_number, 'sms': sms_text}, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                self._count('connection_error', time.monotonic() - started)
+                if _is_connect_failure(e) and attempt < self.max_retries:
+                    time.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                self._record(healthy=False)
+                raise
+            self._count('ok' if response.status_code == 200 else 'http_error', time.monotonic() - started, response.status_code)
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            self._record(healthy=response.status_code < 500)
+            return response
@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+import datetime
+import time
+
+import metrics
+import storage
+
+# --- Persistent SMS Dispatch Queue ---
+# Webhook handlers only insert a row into `pending_sms`; a pool of background
+# sender threads claims rows, calls the gateway and writes the `sms_log` row.
+# Rows live in the database, so anything still queued survives a restart.
+#
+# A claimed row holds a lease that a heartbeat thread keeps refreshing while
+# the gateway call runs, however long retries and throttling take. A row whose
+# lease runs out anyway was left mid-send by a dead process; it may or may not
+# have gone out, so, like an orphaned campaign number, it is reported as
+# failed rather than sent again.
+#
+# Each row carries the hold_id of its send-limit reservation. The hold is
+# released in the transaction that records the result or drops the orphan.
+
+
+class SmsDispatcher:
+    def __init__(self, send, on_result, release=None, workers=2, poll_interval=1.0, lease_seconds=120):
+        # send(job) -> (delivered, details); on_result(job, delivered, details)
+        # release(hold_id) frees a job's send-limit slots; it runs inside the
+        # transaction that removes the job.
+        self.send = send
+        self.on_result = on_result
+        self.release = release or (lambda hold_id: None)
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._sending = set()
+        self._sending_lock = threading.Lock()
+
+    # --- Producer side (called from webhook handlers) ---
+    @metrics.timed_query
+    def enqueue(self, user_id, first_name, chat_id, reply_message_id, phone_number, message, hold_id=None):
+        cur = storage.execute(
+            "INSERT INTO pending_sms (user_id, first_name, chat_id, reply_message_id, phone_number, message, created_at, hold_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, first_name, chat_id, reply_message_id, phone_number, message, datetime.datetime.now().isoformat(), hold_id))
+        self._wakeup.set()
+        return cur.lastrowid
+
+    @metrics.timed_query
+    def depth(self):
+        return storage.fetch_value("SELECT COUNT(*) FROM pending_sms")
+
+    # --- Consumer side (background senders) ---
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"sms-sender-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._run_leases, name="sms-leases", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    @metrics.timed_query
+    def _claim(self):
+        now = time.time()
+        with storage.transaction() as conn:
+            job = conn.execute("SELECT * FROM pending_sms WHERE status = 'queued' ORDER BY sms_id LIMIT 1").fetchone()
+            if job:
+                conn.execute("UPDATE pending_sms SET status = 'sending', claimed_at = ?, attempts = attempts + 1 WHERE sms_id = ?", (now, job['sms_id']))
+        return dict(job) if job else None
+
+    # --- Leases ---
+    @metrics.timed_query
+    def _renew_leases(self):
+        with self._sending_lock:
+            sms_ids = list(self._sending)
+        if sms_ids:
+            now = time.time()
+            with storage.transaction() as conn:
+                conn.executemany("UPDATE pending_sms SET claimed_at = ? WHERE sms_id = ? AND status = 'sending'", [(now, sms_id) for sms_id in sms_ids])
+
+    @metrics.timed_query
+    def _claim_orphans(self):
+        # Rows whose sender stopped renewing the lease; removed here so exactly
+        # one process reports each of them.
+        with storage.transaction() as conn:
+            jobs = conn.execute("SELECT * FROM pending_sms WHERE status = 'sending' AND claimed_at < ?", (time.time() - self.lease_seconds,)).fetchall()
+            conn.executemany("DELETE FROM pending_sms WHERE sms_id = ?", [(job['sms_id'],) for job in jobs])
+            for job in jobs:
+                self.release(job['hold_id'])
+        return [dict(job) for job in jobs]
+
+    def _run_leases(self):
+        while True:
+            try:
+                self._renew_leases()
+                for job in self._claim_orphans():
+                    print(f"SMS {job['sms_id']} was left mid-send; reporting it as failed.")
+                    self._report(job, False, None)
+            except sqlite3.Error as e:
+                print(f"SMS queue lease update failed: {e}")
+            time.sleep(self.lease_seconds / 4)
+
+    @metrics.timed_query
+    def _finish(self, job, delivered):
+        with storage.transaction() as conn:
+            if delivered:
+                storage.record_sms(job['user_id'], job['phone_number'], job['message'], datetime.datetime.now())
+            conn.execute("DELETE FROM pending_sms WHERE sms_id = ?", (job['sms_id'],))
+            self.release(job['hold_id'])
+
+    def _store_result(self, job, delivered):
+        # The gateway has answered, so keep trying (the lease is still being
+        # renewed) rather than leave the row to be reaped and reported wrongly.
+        while True:
+            try:
+                self._finish(job, delivered)
+                return
+            except sqlite3.Error as e:
+                print(f"SMS queue could not record result for {job['sms_id']}, retrying: {e}")
+                time.sleep(self.poll_interval)
+
+    def _report(self, job, delivered, details):
+        try:
+            self.on_result(job, delivered, details)
+        except Exception as e:
+            print(f"SMS queue result callback failed for {job['sms_id']}: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"SMS queue claim failed: {e}")
+                job = None
+            if not job:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            with self._sending_lock:
+                self._sending.add(job['sms_id'])
+            try:
+                try:
+                    delivered, details = self.send(job)
+                except Exception as e:
+                    print(f"SMS queue send failed for {job['sms_id']}: {e}")
+                    delivered, details = False, None
+                self._store_result(job, delivered)
+            finally:
+                with self._sending_lock:
+                    self._sending.discard(job['sms_id'])
+            self._report(job, delivered, details)
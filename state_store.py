@@ -0,0 +1,139 @@
+import atexit
+import threading
+import time
+
+import metrics
+import storage
+
+# --- Conversation State Store ---
+# Holds each user's pending conversation step ("awaiting_number" plus the
+# number typed so far, an admin's "set_bonus" prompt, ...) so ordinary chat
+# messages are answered from memory instead of a SELECT/UPDATE per message.
+# Entries are keyed by (user_id, scope); scope USER is the user flow, ADMIN
+# the admin prompts. The memory is per process, like OrderedUpdatePool's
+# per-chat ordering and de-duplication, so the bot runs as a single gunicorn
+# worker. Both stores share the same interface:
+#   get(user_id, scope) -> (action, data) or None
+#   set(user_id, action, data=None, scope) -- action None clears the entry
+#   pop(user_id, scope) -> (action, data) or None, clearing the entry
+
+USER, ADMIN = 'user', 'admin'
+
+
+class MemoryStateStore:
+    def __init__(self, ttl=86400):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _changed(self, key):
+        # Hook for the persistent store below.
+        pass
+
+    def get(self, user_id, scope=USER):
+        key = (user_id, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            action, data, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._changed(key)
+                return None
+            return action, data
+
+    def set(self, user_id, action, data=None, scope=USER):
+        key = (user_id, scope)
+        with self._lock:
+            if action is None:
+                if self._entries.pop(key, None) is None:
+                    return
+            else:
+                self._entries[key] = (action, data, time.monotonic() + self.ttl)
+            self._changed(key)
+
+    def pop(self, user_id, scope=USER):
+        key = (user_id, scope)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._changed(key)
+            action, data, expires_at = entry
+            return (action, data) if expires_at > time.monotonic() else None
+
+    def sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[2] <= now]:
+                del self._entries[key]
+                self._changed(key)
+
+    def start(self):
+        def run():
+            while True:
+                time.sleep(60)
+                self.sweep()
+        threading.Thread(target=run, name="state-sweeper", daemon=True).start()
+
+
+class SqliteStateStore(MemoryStateStore):
+    # Write-behind: reads and writes only touch memory; a background thread
+    # copies changed entries back to the `users` columns every
+    # `flush_interval` seconds in a single transaction, so state survives a
+    # restart without a commit per message.
+
+    def __init__(self, ttl=86400, flush_interval=2.0):
+        super().__init__(ttl)
+        self.flush_interval = flush_interval
+        self._dirty = set()
+        self._load()
+
+    @metrics.timed_query
+    def _load(self):
+        expires_at = time.monotonic() + self.ttl
+        for user_id, action, data, admin_action in storage.fetch_all("SELECT user_id, current_action, temp_data, temp_admin_action FROM users WHERE current_action IS NOT NULL OR temp_admin_action IS NOT NULL"):
+            if action:
+                self._entries[(user_id, USER)] = (action, data, expires_at)
+            if admin_action:
+                self._entries[(user_id, ADMIN)] = (admin_action, None, expires_at)
+
+    def _changed(self, key):
+        self._dirty.add(key)
+
+    @metrics.timed_query
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            changes = [(key, self._entries.get(key)) for key in self._dirty]
+            self._dirty.clear()
+        try:
+            with storage.transaction() as conn:
+                for (user_id, scope), entry in changes:
+                    action, data = entry[:2] if entry else (None, None)
+                    if scope == ADMIN:
+                        conn.execute("UPDATE users SET temp_admin_action = ? WHERE user_id = ?", (action, user_id))
+                    else:
+                        conn.execute("UPDATE users SET current_action = ?, temp_data = ? WHERE user_id = ?", (action, data, user_id))
+        except Exception:
+            # Retry these keys on the next flush.
+            with self._lock:
+                self._dirty.update(key for key, _ in changes)
+            raise
+
+    def start(self):
+        def run():
+            last_sweep = time.monotonic()
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    if time.monotonic() - last_sweep >= 60:
+                        self.sweep()
+                        last_sweep = time.monotonic()
+                    self.flush()
+                except Exception as e:
+                    print(f"State store flush failed: {e}")
+        threading.Thread(target=run, name="state-flusher", daemon=True).start()
+        atexit.register(self.flush)
@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import counters
+import metrics
+import migrations
+
+# --- Storage Layer ---
+# Every thread gets its own connection (WAL, synchronous=NORMAL, busy timeout),
+# so handlers never share a cursor. Statements are constant strings and each
+# connection keeps a compiled-statement cache, so repeated queries reuse their
+# prepared statements. Multi-statement writes go through transaction().
+
+DB_PATH = os.environ.get("DB_PATH", "sms_bot.db")
+BUSY_TIMEOUT_MS = 30000
+
+_local = threading.local()
+
+
+def get_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        # Only takes effect on a brand-new file, before WAL writes the header;
+        # existing files switch once with `manage.py enable-incremental-vacuum`.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        _local.conn = conn
+        _local.depth = 0
+    return conn
+
+
+@contextmanager
+def transaction():
+    # Re-entrant: only the outermost block issues BEGIN/COMMIT.
+    conn = get_connection()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth = 1
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        _local.depth = 0
+
+
+def fetch_one(sql, params=()):
+    return get_connection().execute(sql, params).fetchone()
+
+
+def fetch_all(sql, params=()):
+    return get_connection().execute(sql, params).fetchall()
+
+
+def fetch_value(sql, params=()):
+    row = fetch_one(sql, params)
+    return row[0] if row else None
+
+
+def execute(sql, params=()):
+    return get_connection().execute(sql, params)
+
+
+# --- Schema ---
+def setup_database():
+    migrations.migrate(get_connection())
+
+
+# --- Users ---
+@metrics.timed_query
+def user_exists(user_id):
+    return fetch_one("SELECT 1 FROM users WHERE user_id = ?", (user_id,)) is not None
+
+
+@metrics.timed_query
+def create_user(user_id, first_name, username, today):
+    with transaction() as conn:
+        cur = conn.execute("INSERT OR IGNORE INTO users (user_id, first_name, username, last_sms_date) VALUES (?, ?, ?, ?)", (user_id, first_name, username, today))
+        if cur.rowcount:
+            counters.bump_global(conn, 'users_total')
+
+
+@metrics.timed_query
+def update_user_names(user_id, first_name, username):
+    execute("UPDATE users SET first_name = ?, username = ? WHERE user_id = ?", (first_name, username, user_id))
+
+
+@metrics.timed_query
+def add_bonus(user_id, amount):
+    # Returns False if there is no such user.
+    return execute("UPDATE users SET bonus_sms = bonus_sms + ? WHERE user_id = ?", (amount, user_id)).rowcount > 0
+
+
+@metrics.timed_query
+def get_quota(user_id, today):
+    # Returns (sms_sent_today, bonus_sms); (0, 0) for an unknown user.
+    row = fetch_one("SELECT u.bonus_sms, COALESCE(d.count, 0) FROM users u LEFT JOIN user_daily_sms d ON d.user_id = u.user_id AND d.day = ? WHERE u.user_id = ?", (today, user_id))
+    return (row[1], row[0]) if row else (0, 0)
+
+
+@metrics.timed_query
+def get_profile(user_id, today):
+    # Returns (sms_sent_today, bonus_sms, total_sent_ever) from the counters.
+    row = fetch_one('''
+        SELECT COALESCE(d.count, 0), COALESCE(u.bonus_sms, 0), COALESCE(t.total, 0)
+        FROM (SELECT ? AS user_id) k
+        LEFT JOIN users u ON u.user_id = k.user_id
+        LEFT JOIN user_daily_sms d ON d.user_id = k.user_id AND d.day = ?
+        LEFT JOIN user_sms_totals t ON t.user_id = k.user_id''', (user_id, today))
+    return row[0], row[1], row[2]
+
+
+@metrics.timed_query
+def count_users():
+    return fetch_value("SELECT value FROM global_counters WHERE name = 'users_total'") or 0
+
+
+@metrics.timed_query
+def get_users_page(limit, cursor=None, newer=False):
+    # Keyset page of users, highest user_id first. `cursor` is the user_id at
+    # the edge of the previous page; newer=True walks back towards the start.
+    if cursor is None:
+        return fetch_all("SELECT u.user_id, u.first_name, u.username, COALESCE(t.total, 0) FROM users u LEFT JOIN user_sms_totals t ON t.user_id = u.user_id ORDER BY u.user_id DESC LIMIT ?", (limit,))
+    if newer:
+        rows = fetch_all("SELECT u.user_id, u.first_name, u.username, COALESCE(t.total, 0) FROM users u LEFT JOIN user_sms_totals t ON t.user_id = u.user_id WHERE u.user_id > ? ORDER BY u.user_id ASC LIMIT ?", (cursor, limit))
+        return rows[::-1]
+    return fetch_all("SELECT u.user_id, u.first_name, u.username, COALESCE(t.total, 0) FROM users u LEFT JOIN user_sms_totals t ON t.user_id = u.user_id WHERE u.user_id < ? ORDER BY u.user_id DESC LIMIT ?", (cursor, limit))
+
+
+# --- SMS Log ---
+@metrics.timed_query
+def record_sms(user_id, phone_number, message, now):
+    today = str(now.date())
+    with transaction() as conn:
+        conn.execute("INSERT INTO sms_log (user_id, phone_number, message, timestamp, day) VALUES (?, ?, ?, ?, ?)", (user_id, phone_number, message, now.isoformat(), today))
+        counters.record_sms(conn, user_id, phone_number, today)
+
+
+@metrics.timed_query
+def count_number_sms_on(user_id, phone_number, day):
+    return fetch_value("SELECT count FROM number_daily_sms WHERE user_id = ? AND phone_number = ? AND day = ?", (user_id, phone_number, day)) or 0
+
+
+@metrics.timed_query
+def count_user_sms(user_id):
+    return fetch_value("SELECT total FROM user_sms_totals WHERE user_id = ?", (user_id,)) or 0
+
+
+@metrics.timed_query
+def count_user_log_rows(user_id):
+    # Rows still in sms_log, i.e. what history can page through; archived
+    # rows only survive as rollup counts.
+    return fetch_value("SELECT COALESCE((SELECT total FROM user_sms_totals WHERE user_id = ?), 0) - COALESCE((SELECT SUM(count) FROM sms_log_rollup WHERE user_id = ?), 0)", (user_id, user_id))
+
+
+@metrics.timed_query
+def get_user_sms_page(user_id, limit, cursor=None, newer=False):
+    # Keyset page of a user's log, newest first. `cursor` is the
+    # (timestamp, log_id) at the edge of the previous page; newer=True returns
+    # the rows just above it instead of just below.
+    if cursor is None:
+        return fetch_all("SELECT phone_number, timestamp, log_id FROM sms_log WHERE user_id = ? ORDER BY timestamp DESC, log_id DESC LIMIT ?", (user_id, limit))
+    if newer:
+        rows = fetch_all("SELECT phone_number, timestamp, log_id FROM sms_log WHERE user_id = ? AND (timestamp, log_id) > (?, ?) ORDER BY timestamp ASC, log_id ASC LIMIT ?", (user_id, cursor[0], cursor[1], limit))
+        return rows[::-1]
+    return fetch_all("SELECT phone_number, timestamp, log_id FROM sms_log WHERE user_id = ? AND (timestamp, log_id) < (?, ?) ORDER BY timestamp DESC, log_id DESC LIMIT ?", (user_id, cursor[0], cursor[1], limit))
+
+
+@metrics.timed_query
+def count_all_sms():
+    return fetch_value("SELECT value FROM global_counters WHERE name = 'sms_total'") or 0
+
+
+@metrics.timed_query
+def count_sms_on(day):
+    return fetch_value("SELECT count FROM daily_sms WHERE day = ?", (day,)) or 0
+
+
+# --- Counter Maintenance ---
+@metrics.timed_query
+def rebuild_counters():
+    with transaction() as conn:
+        counters.rebuild(conn)
+
+
+@metrics.timed_query
+def check_counters():
+    with transaction() as conn:
+        return counters.check(conn)
@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# --- Test Setup ---
+# Tests run against a throwaway database and the bench/ stand-ins for the
+# Telegram Bot API and the SMS gateway. DB_PATH is set here, before any test
+# module imports storage; the bot itself is imported once per session.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'bench')]
+
+WORKDIR = tempfile.mkdtemp(prefix='smsbot-tests-')
+os.environ['DB_PATH'] = os.path.join(WORKDIR, 'sms_bot.db')
+os.environ['ARCHIVE_DIR'] = os.path.join(WORKDIR, 'archive')
+
+BOT_TOKEN = "123456:test"
+ADMIN_ID = 1
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def db():
+    import storage
+    storage.setup_database()
+    return storage
+
+
+@pytest.fixture(scope='session')
+def telegram():
+    from fakes import FakeTelegram
+    fake = FakeTelegram().start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture(scope='session')
+def gateway():
+    from fakes import FakeGateway
+    fake = FakeGateway().start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture(scope='session')
+def bot(db, telegram, gateway):
+    os.environ.update({
+        'BOT_TOKEN': BOT_TOKEN,
+        'CHANNEL_ID': '@test_channel',
+        'ADMIN_IDS': str(ADMIN_ID),
+        'SMS_API_URL': f"{gateway.url}/send",
+        'WEBHOOK_URL': 'http://127.0.0.1',
+        'TELEGRAM_API_URL': telegram.url,
+    })
+    import main
+    return main
+
+
+@pytest.fixture
+def client(bot):
+    return bot.app.test_client()
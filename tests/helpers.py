@@ -0,0 +1,54 @@
+import itertools
+import json
+import threading
+import time
+
+from conftest import BOT_TOKEN
+
+# --- Update Builders and Bot API Expectations ---
+
+_ids = itertools.count(int(time.time()))
+
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}", 'username': f"user{user_id}"}
+
+
+def message_update(user_id, text):
+    message = {'message_id': next(_ids), 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'}, 'from': _user(user_id), 'text': text}
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': next(_ids), 'message': message}
+
+
+def callback_update(user_id, data, message_id=1):
+    message = {'message_id': message_id, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'}, 'text': 'test'}
+    return {'update_id': next(_ids), 'callback_query': {'id': f"query{next(_ids)}", 'chat_instance': 'test', 'from': _user(user_id), 'message': message, 'data': data}}
+
+
+def post_update(client, update, headers=None):
+    return client.post(f"/{BOT_TOKEN}", data=json.dumps(update), content_type='application/json', headers=headers or {})
+
+
+def expect(telegram, chat_id, predicate=None):
+    # Returns wait(timeout) -> (method, params, result) for the first later
+    # Bot API call to chat_id matching predicate(method, params), or None.
+    seen = []
+    done = threading.Event()
+
+    def callback(method, params, result):
+        seen.append((method, params, result))
+        done.set()
+    telegram.expect(chat_id, callback, predicate)
+
+    def wait(timeout=10):
+        return seen[0] if done.wait(timeout) else None
+    return wait
+
+
+def sent_text(prefix):
+    return lambda method, params: method == 'sendMessage' and params.get('text', '').startswith(prefix)
+
+
+def edited_text(prefix):
+    return lambda method, params: method == 'editMessageText' and params.get('text', '').startswith(prefix)
@@ -0,0 +1,54 @@
+import datetime
+import gzip
+import shutil
+import sqlite3
+import threading
+
+import backup
+import counters
+import storage
+
+
+def test_backup_is_consistent_while_writers_commit(db, tmp_path, monkeypatch):
+    user_ids = [500000 + n for n in range(4)]
+    now = datetime.datetime.now()
+    with storage.transaction() as conn:
+        for index in range(5000):
+            counters.record_sms(conn, user_ids[index % 4], f"018{index:08d}", str(now.date()))
+            conn.execute("INSERT INTO sms_log (user_id, phone_number, message, timestamp, day) VALUES (?, ?, 'seed', ?, ?)", (user_ids[index % 4], f"018{index:08d}", now.isoformat(), str(now.date())))
+    # Copy a few pages per step so the writers below commit mid-backup.
+    snapshot = backup.snapshot
+    monkeypatch.setattr(backup, 'snapshot', lambda dest_path: snapshot(dest_path, pages=4, sleep=0.002))
+
+    stop = threading.Event()
+    written = [0] * len(user_ids)
+
+    def write(slot, user_id):
+        while not stop.is_set():
+            storage.record_sms(user_id, f"019{written[slot] % 7:08d}", "during backup", datetime.datetime.now())
+            written[slot] += 1
+
+    writers = [threading.Thread(target=write, args=(slot, user_id)) for slot, user_id in enumerate(user_ids)]
+    for writer in writers:
+        writer.start()
+    try:
+        before = sum(written)
+        backup.write_backup(str(tmp_path / 'backup.db.gz'))
+        during = sum(written) - before
+    finally:
+        stop.set()
+        for writer in writers:
+            writer.join()
+    assert during > 0
+
+    with gzip.open(tmp_path / 'backup.db.gz', 'rb') as source, open(tmp_path / 'backup.db', 'wb') as dest:
+        shutil.copyfileobj(source, dest)
+    conn = sqlite3.connect(tmp_path / 'backup.db')
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+        assert counters.check(conn) == {}
+        copied = conn.execute(f"SELECT COUNT(*) FROM sms_log WHERE user_id IN ({','.join('?' * len(user_ids))})", user_ids).fetchone()[0]
+    finally:
+        conn.close()
+    assert 5000 + before <= copied <= 5000 + sum(written)
+    assert storage.check_counters() == {}
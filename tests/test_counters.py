@@ -0,0 +1,100 @@
+import datetime
+import sqlite3
+import threading
+
+import counters
+import manage
+import migrations
+import storage
+from retention import RetentionWorker
+
+
+def _counter_rows(user_ids):
+    marks = ','.join('?' * len(user_ids))
+    return (
+        storage.fetch_all(f"SELECT user_id, total FROM user_sms_totals WHERE user_id IN ({marks}) ORDER BY user_id", user_ids),
+        storage.fetch_all(f"SELECT user_id, day, count FROM user_daily_sms WHERE user_id IN ({marks}) ORDER BY user_id, day", user_ids),
+        storage.fetch_all(f"SELECT user_id, phone_number, day, count FROM number_daily_sms WHERE user_id IN ({marks}) ORDER BY user_id, phone_number, day", user_ids),
+    )
+
+
+def test_counters_match_the_log_after_concurrent_sends(db):
+    user_ids = [400000 + n for n in range(8)]
+    today = datetime.datetime.now()
+
+    def send(user_id):
+        for index in range(60):
+            sent_at = today - datetime.timedelta(days=index % 5)
+            storage.record_sms(user_id, f"017{index % 4:08d}", "counted", sent_at)
+
+    threads = [threading.Thread(target=send, args=(user_id,)) for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert storage.check_counters() == {}
+    for user_id in user_ids:
+        assert storage.count_user_sms(user_id) == 60
+        assert storage.get_profile(user_id, str(today.date()))[0] == 12
+        assert storage.count_number_sms_on(user_id, "01700000000", str(today.date())) == 3
+    before = _counter_rows(user_ids)
+    storage.rebuild_counters()
+    assert [list(map(tuple, rows)) for rows in _counter_rows(user_ids)] == [list(map(tuple, rows)) for rows in before]
+    assert storage.check_counters() == {}
+
+
+def test_counters_survive_archiving(db, tmp_path):
+    user_id = 400100
+    long_ago = datetime.datetime.now() - datetime.timedelta(days=400)
+    for index in range(30):
+        storage.record_sms(user_id, "01711111111", "old", long_ago + datetime.timedelta(days=index % 3))
+    storage.record_sms(user_id, "01711111111", "new", datetime.datetime.now())
+    totals = storage.get_profile(user_id, str(datetime.date.today()))
+    all_sms = storage.count_all_sms()
+
+    worker = RetentionWorker(retention_days=365, archive_dir=str(tmp_path), batch_size=7)
+    assert worker.run_once() >= 30
+    assert storage.fetch_value("SELECT COUNT(*) FROM sms_log WHERE user_id = ?", (user_id,)) == 1
+    assert storage.get_profile(user_id, str(datetime.date.today())) == totals
+    assert storage.count_all_sms() == all_sms
+    assert storage.check_counters() == {}
+    storage.rebuild_counters()
+    assert storage.get_profile(user_id, str(datetime.date.today())) == totals
+    assert storage.check_counters() == {}
+    # History pages only through the rows that are left.
+    assert storage.count_user_sms(user_id) == 31
+    assert storage.count_user_log_rows(user_id) == 1
+
+
+def test_apply_retention_finishes_on_a_file_without_incremental_vacuum(tmp_path, monkeypatch):
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("CREATE TABLE filler (data BLOB)")
+    conn.executemany("INSERT INTO filler VALUES (zeroblob(4000))", [()] * 200)
+    conn.execute("DROP TABLE filler")
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] > 0
+    conn.close()
+    monkeypatch.setattr(storage, 'DB_PATH', path)
+    monkeypatch.setattr(storage, '_local', threading.local())
+
+    result = []
+    runner = threading.Thread(target=lambda: result.append(manage.main(['apply-retention', '--days', '30', '--archive-dir', str(tmp_path)])), daemon=True)
+    runner.start()
+    runner.join(timeout=30)
+    assert result == [0]
+
+
+def test_migrations_build_counters_from_an_existing_log(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'old.db'), isolation_level=None)
+    migrations.MIGRATIONS[0](conn)
+    conn.execute("PRAGMA user_version = 1")
+    conn.executemany("INSERT INTO users (user_id) VALUES (?)", [(1,), (2,)])
+    conn.executemany("INSERT INTO sms_log (user_id, phone_number, message, timestamp) VALUES (?, ?, 'old', ?)",
+                     [(1 + n % 2, f"0170000000{n % 3}", f"2024-01-0{1 + n % 4}T10:00:00") for n in range(40)])
+    migrations.migrate(conn)
+    assert counters.check(conn) == {}
+    assert conn.execute("SELECT total FROM user_sms_totals WHERE user_id = 1").fetchone()[0] == 20
+    assert conn.execute("SELECT value FROM global_counters WHERE name = 'users_total'").fetchone()[0] == 2
+    conn.close()
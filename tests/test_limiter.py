@@ -0,0 +1,123 @@
+import datetime
+import json
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import storage
+from helpers import expect, message_update, post_update, sent_text
+from limiter import Limiter, LimitExceeded, Policy, TokenBucket
+
+
+def _user_limiter():
+    def load(user_id, day):
+        sms_sent, bonus_sms = storage.get_quota(user_id, day)
+        return sms_sent, 10 + bonus_sms
+    return Limiter([Policy('user', load)])
+
+
+def _reserve_all(limiters, user_id, attempts):
+    granted = []
+
+    def reserve(index):
+        limiter = limiters[index % len(limiters)]
+        try:
+            granted.append(limiter.reserve(limiter.reservation(user=user_id)))
+        except LimitExceeded:
+            pass
+
+    threads = [threading.Thread(target=reserve, args=(index,)) for index in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return granted
+
+
+def test_concurrent_reservations_never_exceed_the_limit(db):
+    # Each limiter stands in for a gunicorn worker; they share only the database.
+    user_id = 700000
+    storage.create_user(user_id, "limit", "limit", str(datetime.date.today()))
+    limiters = [_user_limiter() for _ in range(4)]
+    granted = _reserve_all(limiters, user_id, 32)
+    assert len(granted) == 10
+
+    # Three go out and two fail; only the two failed slots come back.
+    with storage.transaction():
+        for reservation in granted[:3]:
+            storage.record_sms(user_id, "01700000000", "limit", datetime.datetime.now())
+            limiters[0].release(reservation.hold_id)
+    for reservation in granted[3:5]:
+        limiters[1].release(reservation.hold_id)
+    assert len(_reserve_all(limiters, user_id, 8)) == 2
+
+
+def test_token_buckets_share_one_rate(db):
+    # Two buckets stand in for two gunicorn workers pacing the same gateway.
+    buckets = [TokenBucket(20, capacity=1, name='test-gateway') for _ in range(2)]
+    started = time.monotonic()
+    threads = [threading.Thread(target=lambda bucket=bucket: [bucket.acquire() for _ in range(10)]) for bucket in buckets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 20 calls at 20 per second: the last one waits 19 intervals.
+    assert time.monotonic() - started >= 0.9
+
+
+def test_referral_to_an_unknown_user_creates_nobody(bot, client, telegram):
+    users_before = storage.count_users()
+    welcomed = expect(telegram, 700100, sent_text("স্বাগতম!"))
+    assert post_update(client, message_update(700100, "/start 424242")).status_code == 200
+    assert welcomed()
+    assert storage.user_exists(700100)
+    assert not storage.user_exists(424242)
+    assert storage.count_users() == users_before + 1
+
+
+def test_two_workers_send_no_more_than_the_daily_limit(tmp_path):
+    pytest.importorskip('gunicorn')
+    from fakes import FakeGateway, FakeTelegram
+    from run import BOT_TOKEN as BENCH_BOT_TOKEN, REPO_ROOT, bot_env, free_port, server_command, stop_server, wait_until_ready
+
+    telegram = FakeTelegram().start()
+    gateway = FakeGateway(latency=0.05).start()
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = bot_env(telegram, gateway, base_url, str(tmp_path), [1])
+    process = subprocess.Popen(server_command('2x8', port), cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(base_url, process)
+        user_id = 700200
+        updates = [message_update(user_id, f"/sms 0171{number:07d} limit") for number in range(30)]
+
+        def post(update):
+            return requests.post(f"{base_url}/{BENCH_BOT_TOKEN}", data=json.dumps(update), headers={'Content-Type': 'application/json'}, timeout=10).status_code
+
+        with ThreadPoolExecutor(max_workers=30) as pool:
+            assert set(pool.map(post, updates)) == {200}
+        # Every /sms is answered ("queued" or the limit message), then each
+        # queued SMS is edited once its result is recorded.
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            calls = dict(telegram.calls)
+            if calls.get('sendMessage', 0) >= 30 and calls.get('editMessageText', 0) >= gateway.calls.get('ok', 0) >= 10:
+                break
+            time.sleep(0.1)
+        time.sleep(1)
+        assert gateway.calls.get('ok', 0) == 10
+        conn = sqlite3.connect(env['DB_PATH'])
+        try:
+            assert conn.execute("SELECT COUNT(*) FROM sms_log WHERE user_id = ?", (user_id,)).fetchone()[0] == 10
+            assert conn.execute("SELECT COUNT(*) FROM send_holds").fetchone()[0] == 0
+        finally:
+            conn.close()
+    finally:
+        stop_server(process)
+        telegram.stop()
+        gateway.stop()
@@ -0,0 +1,59 @@
+import time
+
+import storage
+from helpers import edited_text, expect, message_update, post_update, sent_text
+from sms_queue import SmsDispatcher
+
+
+def _insert_sending(user_id, claimed_at):
+    cur = storage.execute("INSERT INTO pending_sms (user_id, first_name, chat_id, reply_message_id, phone_number, message, status, attempts, created_at, claimed_at) VALUES (?, 'test', ?, 1, '01700000000', 'test', 'sending', 1, '2024-01-01T00:00:00', ?)", (user_id, user_id, claimed_at))
+    return cur.lastrowid
+
+
+def test_webhook_returns_while_gateway_is_sleeping(bot, client, telegram, gateway):
+    user_id = 100001
+    gateway.latency = 2.0
+    try:
+        queued = expect(telegram, user_id, sent_text("⏳"))
+        delivered = expect(telegram, user_id, edited_text("✅"))
+        sent_before = gateway.calls.get('ok', 0)
+        started = time.perf_counter()
+        response = post_update(client, message_update(user_id, "/sms 01700000001 hello"))
+        acked = time.perf_counter() - started
+        assert response.status_code == 200
+        assert acked < 0.1
+        # The handler replies "queued" without waiting for the gateway either.
+        assert queued(1.5)
+        assert gateway.calls.get('ok', 0) == sent_before
+        assert delivered(10)
+    finally:
+        gateway.latency = 0.0
+    assert storage.count_user_sms(user_id) == 1
+    assert storage.fetch_value("SELECT COUNT(*) FROM pending_sms WHERE user_id = ?", (user_id,)) == 0
+
+
+def test_orphaned_send_is_reported_failed_not_resent(db):
+    sent, results = [], []
+    dispatcher = SmsDispatcher(lambda job: sent.append(job), lambda job, delivered, details: results.append((job['sms_id'], delivered)), lease_seconds=1)
+    sms_id = _insert_sending(100002, time.time() - 10)
+    orphans = dispatcher._claim_orphans()
+    assert [job['sms_id'] for job in orphans] == [sms_id]
+    for job in orphans:
+        dispatcher._report(job, False, None)
+    assert results == [(sms_id, False)]
+    assert not sent
+    assert storage.fetch_one("SELECT 1 FROM pending_sms WHERE sms_id = ?", (sms_id,)) is None
+
+
+def test_lease_is_renewed_during_a_long_send(db):
+    dispatcher = SmsDispatcher(None, None, lease_seconds=1)
+    sms_id = _insert_sending(100003, time.time())
+    dispatcher._sending.add(sms_id)
+    try:
+        for _ in range(6):
+            time.sleep(0.25)
+            dispatcher._renew_leases()
+        assert time.time() - storage.fetch_value("SELECT claimed_at FROM pending_sms WHERE sms_id = ?", (sms_id,)) < 0.5
+        assert sms_id not in [job['sms_id'] for job in dispatcher._claim_orphans()]
+    finally:
+        storage.execute("DELETE FROM pending_sms WHERE sms_id = ?", (sms_id,))
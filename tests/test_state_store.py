@@ -0,0 +1,49 @@
+import datetime
+import threading
+
+import storage
+from state_store import ADMIN, SqliteStateStore
+
+
+def test_state_survives_a_restart_after_a_flush(db):
+    user_id = 600000
+    db.create_user(user_id, "first", "first", str(datetime.date.today()))
+    store = SqliteStateStore()
+    store.set(user_id, 'awaiting_message', '01711111111')
+    store.set(user_id, 'set_bonus', scope=ADMIN)
+    store.flush()
+
+    restarted = SqliteStateStore()
+    assert restarted.get(user_id) == ('awaiting_message', '01711111111')
+    assert restarted.get(user_id, scope=ADMIN) == ('set_bonus', None)
+
+    assert restarted.pop(user_id, scope=ADMIN) == ('set_bonus', None)
+    restarted.flush()
+    assert SqliteStateStore().get(user_id, scope=ADMIN) is None
+
+
+def test_idle_messages_do_not_touch_the_database(db, monkeypatch):
+    store = SqliteStateStore()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("state store hit the database")
+
+    for name in ('execute', 'fetch_one', 'fetch_all', 'fetch_value', 'transaction'):
+        monkeypatch.setattr(storage, name, fail)
+    assert store.get(600001) is None
+    assert store.pop(600001, scope=ADMIN) is None
+    store.flush()
+
+
+def test_only_one_thread_pops_an_entry(db):
+    user_id = 600002
+    db.create_user(user_id, "second", "second", str(datetime.date.today()))
+    store = SqliteStateStore()
+    store.set(user_id, 'set_bonus', scope=ADMIN)
+    popped = []
+    threads = [threading.Thread(target=lambda: popped.append(store.pop(user_id, scope=ADMIN))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [entry for entry in popped if entry] == [('set_bonus', None)]
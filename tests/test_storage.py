@@ -0,0 +1,92 @@
+import datetime
+import re
+import threading
+import time
+
+import storage
+from helpers import callback_update, message_update, post_update
+
+THREADS = 16
+SENDS_PER_THREAD = 40
+
+
+def _phone(user_id, index):
+    # Every number embeds its sender, so a row read for the wrong user shows.
+    return f"01{user_id}{index:03d}"
+
+
+def test_concurrent_writes_and_history_reads_are_not_mixed_up(db):
+    errors = []
+
+    def hammer(user_id):
+        try:
+            for index in range(SENDS_PER_THREAD):
+                storage.record_sms(user_id, _phone(user_id, index), "stress", datetime.datetime.now())
+                page = storage.get_user_sms_page(user_id, 10)
+                assert len(page) == min(index + 1, 10)
+                assert all(row[0].startswith(f"01{user_id}") for row in page)
+                assert storage.count_user_sms(user_id) == index + 1
+            # Walk every history page with the keyset cursor.
+            seen, cursor = [], None
+            while True:
+                page = storage.get_user_sms_page(user_id, 10, cursor)
+                if not page:
+                    break
+                seen.extend(row[0] for row in page)
+                cursor = (page[-1][1], page[-1][2])
+            assert sorted(seen) == [_phone(user_id, index) for index in range(SENDS_PER_THREAD)]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=hammer, args=(200000 + n,)) for n in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors[:3]
+
+
+def test_concurrent_sms_and_history_through_the_webhook(bot, client, telegram):
+    users = [300000 + n for n in range(8)]
+    sends = 5
+    history_texts = {user_id: [] for user_id in users}
+
+    def record_history(user_id):
+        # Never matches, so it sees every call to the chat without consuming it.
+        def predicate(method, params):
+            if method == 'editMessageText' and params.get('text', '').startswith('📜'):
+                history_texts[user_id].append(params['text'])
+            return False
+        return predicate
+
+    recorders = {user_id: record_history(user_id) for user_id in users}
+    for user_id, predicate in recorders.items():
+        telegram.expect(user_id, None, predicate)
+
+    def user_session(user_id):
+        session = client.application.test_client()
+        for index in range(sends):
+            assert post_update(session, message_update(user_id, f"/sms {_phone(user_id, index)} stress")).status_code == 200
+            assert post_update(session, callback_update(user_id, 'history_page_1')).status_code == 200
+
+    threads = [threading.Thread(target=user_session, args=(user_id,)) for user_id in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and any(storage.count_user_sms(user_id) < sends for user_id in users):
+        time.sleep(0.1)
+    for user_id in users:
+        assert storage.count_user_sms(user_id) == sends
+        for text in history_texts[user_id]:
+            assert all(number.startswith(f"01{user_id}") for number in re.findall(r"`(\d+)`", text))
+        history_texts[user_id] = []
+        post_update(client, callback_update(user_id, 'history_page_1'))
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and not all(history_texts.values()):
+        time.sleep(0.1)
+    for user_id in users:
+        telegram.cancel(user_id, None)
+        assert sorted(re.findall(r"`(\d+)`", history_texts[user_id][0])) == [_phone(user_id, index) for index in range(sends)]
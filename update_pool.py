@@ -0,0 +1,64 @@
+import queue
+import threading
+import zlib
+from collections import OrderedDict
+
+# --- Ordered Update Worker Pool ---
+# The webhook hands raw updates to this pool and returns at once. Updates are
+# routed to a worker by user, so different users are processed in parallel
+# while one user's updates run strictly in arrival order (the conversation
+# state machine depends on that). Recently seen update_ids are remembered so
+# Telegram's redeliveries are dropped instead of handled twice.
+
+QUEUED, DUPLICATE, FULL = 'queued', 'duplicate', 'full'
+
+
+class OrderedUpdatePool:
+    def __init__(self, process, workers=4, max_queue=1000, recent_ids=10000):
+        # process(payload) handles one update on a worker thread.
+        self.process = process
+        self.workers = max(1, workers)
+        self.recent_ids = recent_ids
+        self._queues = [queue.Queue(maxsize=max_queue) for _ in range(self.workers)]
+        self._seen = OrderedDict()
+        self._seen_lock = threading.Lock()
+
+    def _remember(self, update_id):
+        with self._seen_lock:
+            if update_id in self._seen:
+                return False
+            self._seen[update_id] = True
+            if len(self._seen) > self.recent_ids:
+                self._seen.popitem(last=False)
+            return True
+
+    def _forget(self, update_id):
+        with self._seen_lock:
+            self._seen.pop(update_id, None)
+
+    def submit(self, update_id, key, payload):
+        if update_id is not None and not self._remember(update_id):
+            return DUPLICATE
+        index = zlib.crc32(str(key).encode()) % self.workers
+        try:
+            self._queues[index].put_nowait(payload)
+        except queue.Full:
+            # Let Telegram redeliver it later rather than dropping it.
+            self._forget(update_id)
+            return FULL
+        return QUEUED
+
+    def depth(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def start(self):
+        for index, work_queue in enumerate(self._queues):
+            threading.Thread(target=self._run, args=(work_queue,), name=f"update-worker-{index}", daemon=True).start()
+
+    def _run(self, work_queue):
+        while True:
+            payload = work_queue.get()
+            try:
+                self.process(payload)
+            except Exception as e:
+                print(f"Update processing failed: {e}")